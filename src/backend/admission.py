@@ -0,0 +1,241 @@
+import asyncio
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from starlette.exceptions import HTTPException
+
+# Admission control for upload routes. Multipart bodies are parsed by FastAPI
+# before an endpoint runs, so limits are enforced by an ASGI middleware that
+# decides from the request line and Content-Length alone, before any body is read,
+# then meters the body as it streams in so it cannot outgrow its reservation.
+UPLOAD_MAX_INFLIGHT_BYTES = int(os.environ.get("PDM_UPLOAD_MAX_INFLIGHT_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_QUEUE_SIZE = int(os.environ.get("PDM_UPLOAD_QUEUE_SIZE", "8")) # Requests allowed to wait per route
+UPLOAD_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("PDM_UPLOAD_QUEUE_TIMEOUT", "2"))
+UPLOAD_RETRY_AFTER_SECONDS = int(os.environ.get("PDM_UPLOAD_RETRY_AFTER", "5"))
+# Bytes reserved for requests without a Content-Length (chunked transfer encoding) on
+# routes that draw on the shared budget; routes with their own cap reserve the cap
+UNKNOWN_LENGTH_BYTES = 32 * 1024 * 1024
+
+# Archives are spooled to disk, not held in memory, so they get their own per-request
+# cap instead of drawing on the shared in-flight budget (concurrency bounds the total).
+UPLOAD_ARCHIVE_MAX_BYTES = int(os.environ.get("PDM_UPLOAD_ARCHIVE_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+
+# Guarded routes: name -> (method, path pattern, max concurrent requests,
+# own per-request byte cap, or None to draw on the shared in-flight budget)
+UPLOAD_ROUTES: Dict[str, Tuple[str, str, int, Optional[int]]] = {
+    "document_upload": ("POST", r"^/documents/upload/product/\d+/?$", int(os.environ.get("PDM_UPLOAD_DOCUMENT_CONCURRENCY", "8")), None),
+    "document_archive": ("POST", r"^/documents/upload/archive/?$", int(os.environ.get("PDM_UPLOAD_ARCHIVE_CONCURRENCY", "2")), UPLOAD_ARCHIVE_MAX_BYTES),
+    "product_import": ("POST", r"^/import/products-files?/?$", int(os.environ.get("PDM_UPLOAD_IMPORT_CONCURRENCY", "2")), None),
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, status_code: int = 503):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code # 503: retry later, 413: too large to ever be admitted
+
+
+class _RouteLimiter:
+    def __init__(self, name: str, method: str, pattern: str, max_concurrent: int, max_request_bytes: Optional[int] = None):
+        self.name = name
+        self.method = method
+        self.pattern = re.compile(pattern)
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_request_bytes = max_request_bytes # Own cap; such routes skip the shared byte budget
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop: # Created lazily on the serving loop
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_request_bytes": self.max_request_bytes,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionController:
+    """
+    Per-route concurrency limits plus a global budget of in-flight upload bytes.
+    A request waits briefly (bounded queue, bounded time) for a route slot and is
+    rejected otherwise, so upload bursts cannot exhaust memory or file descriptors.
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, Tuple[str, str, int, Optional[int]]] = UPLOAD_ROUTES,
+        max_inflight_bytes: int = UPLOAD_MAX_INFLIGHT_BYTES,
+        queue_size: int = UPLOAD_QUEUE_SIZE,
+        queue_timeout: float = UPLOAD_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.limiters: List[_RouteLimiter] = [
+            _RouteLimiter(name, method, pattern, limit, max_bytes) for name, (method, pattern, limit, max_bytes) in routes.items()
+        ]
+        self.max_inflight_bytes = max_inflight_bytes
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.inflight_bytes = 0
+
+    def match(self, method: str, path: str) -> Optional[_RouteLimiter]:
+        for limiter in self.limiters:
+            if limiter.method == method and limiter.pattern.match(path):
+                return limiter
+        return None
+
+    def _reject(self, limiter: _RouteLimiter, reason: str, status_code: int = 503) -> None:
+        limiter.rejected += 1
+        raise AdmissionRejected(reason, status_code)
+
+    def request_limit(self, limiter: _RouteLimiter) -> int:
+        """Largest body a single request on this route may ever send."""
+        if limiter.max_request_bytes is not None:
+            return limiter.max_request_bytes
+        return self.max_inflight_bytes
+
+    def _over_budget(self, limiter: _RouteLimiter, content_length: int) -> bool:
+        if limiter.max_request_bytes is not None:
+            return False # Bounded by its own cap and concurrency limit
+        return self.inflight_bytes + content_length > self.max_inflight_bytes
+
+    async def acquire(self, limiter: _RouteLimiter, content_length: int) -> None:
+        """Admits a request or raises AdmissionRejected. Pair with release()."""
+        if content_length > self.request_limit(limiter): # Would never fit: retrying cannot help
+            self._reject(limiter, f"Upload too large. Maximum size: {self.request_limit(limiter)} bytes", 413)
+        if self._over_budget(limiter, content_length):
+            self._reject(limiter, "Too many upload bytes in flight")
+
+        semaphore = limiter.semaphore()
+        if semaphore.locked():
+            if limiter.waiting >= self.queue_size:
+                self._reject(limiter, "Too many concurrent uploads")
+            limiter.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject(limiter, "Timed out waiting for an upload slot")
+            finally:
+                limiter.waiting -= 1
+        else:
+            await semaphore.acquire()
+
+        if self._over_budget(limiter, content_length): # Re-check after waiting
+            semaphore.release()
+            self._reject(limiter, "Too many upload bytes in flight")
+
+        if limiter.max_request_bytes is None:
+            self.inflight_bytes += content_length
+        limiter.in_flight += 1
+        limiter.admitted += 1
+
+    def release(self, limiter: _RouteLimiter, content_length: int) -> None:
+        if limiter.max_request_bytes is None:
+            self.inflight_bytes -= content_length
+        limiter.in_flight -= 1
+        limiter.semaphore().release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight_bytes": self.inflight_bytes,
+            "max_inflight_bytes": self.max_inflight_bytes,
+            "queue_size": self.queue_size,
+            "routes": {limiter.name: limiter.stats() for limiter in self.limiters},
+        }
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware applying an AdmissionController to matching requests.
+    Busy rejections are answered with 503 and Retry-After, bodies larger than the
+    route can ever admit with 413; other routes pass straight through.
+    """
+
+    def __init__(self, app, controller: "AdmissionController"):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.controller.match(scope["method"], scope["path"])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = None
+        for key, value in scope["headers"]:
+            if key == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+                break
+        if content_length is None: # Chunked
+            if limiter.max_request_bytes is not None: # Own cap, not the shared budget: allow all of it
+                content_length = limiter.max_request_bytes
+            else: # Reserve a fixed share of the shared budget
+                content_length = min(UNKNOWN_LENGTH_BYTES, self.controller.request_limit(limiter))
+
+        try:
+            await self.controller.acquire(limiter, content_length)
+        except AdmissionRejected as e:
+            if e.status_code == 413:
+                response = JSONResponse(status_code=413, content={"detail": f"{e.reason}."})
+            else:
+                response = JSONResponse(
+                    status_code=503,
+                    content={"detail": f"{e.reason}. Please retry later."},
+                    headers={"Retry-After": str(UPLOAD_RETRY_AFTER_SECONDS)},
+                )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def metered_receive():
+            # The reservation is all the body may use: a client that under-declares
+            # its Content-Length or streams chunks past the share is cut off here.
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > content_length:
+                    limiter.rejected += 1
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds its {content_length} byte reservation")
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, metered_receive, tracking_send)
+        except HTTPException as e:
+            if e.status_code != 413 or response_started: # Raised from metered_receive outside a route
+                raise
+            await JSONResponse(status_code=413, content={"detail": e.detail})(scope, receive, send)
+        finally:
+            self.controller.release(limiter, content_length)
+
+
+admission_controller = AdmissionController()
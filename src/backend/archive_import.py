@@ -0,0 +1,373 @@
+import asyncio
+import csv
+import io
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiofiles # For async file operations
+from fastapi import HTTPException, UploadFile
+
+from src.backend.compression import remove_precompressed_variants, write_precompressed_variants
+from src.backend.import_utils import EXPECTED_COLUMNS, decode_text_content
+from src.backend.jobs import update_job_progress
+from src.backend.models import DOCUMENT_TYPES, Document, Product
+from src.backend.search import extraction_service
+
+# Archive formats accepted by the bulk document upload endpoint
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# Optional manifest at the archive root mapping files to product references.
+# Without a manifest, files are matched by naming convention:
+#   <ref>/<filename>       (one folder per product reference), or
+#   <ref>__<filename>      (reference prefix on the file name)
+MANIFEST_FILENAME = "manifest.csv"
+REF_SEPARATOR = "__"
+
+# Manifest column names (case-insensitive matching), same idea as EXPECTED_COLUMNS for product imports
+MANIFEST_COLUMNS = {
+    'file': ['file', 'filename', 'file name', 'path'],
+    'ref': EXPECTED_COLUMNS['ref'],
+    'type': ['type', 'doc_type', 'document type'],
+    'label': ['label', 'title'],
+}
+
+# Guess Document.type from the file extension when the manifest does not say
+EXTENSION_DOC_TYPES = {
+    '.pdf': 'pdf',
+    '.xlsx': 'excel', '.xlsm': 'excel', '.xls': 'excel', '.csv': 'excel',
+    '.png': 'image', '.jpg': 'image', '.jpeg': 'image', '.gif': 'image',
+    '.webp': 'image', '.bmp': 'image', '.tif': 'image', '.tiff': 'image',
+}
+
+REF_LOOKUP_CHUNK_SIZE = 500 # Stay well below SQLite's bound-variable limit
+DOCUMENT_BATCH_SIZE = 500 # Files extracted and inserted per bulk_create round
+EXTRACT_WORKERS = 8 # Concurrent file writes for zip archives (tar streams are read sequentially)
+COPY_CHUNK_SIZE = 1024 * 1024
+MAX_MEMBER_SIZE = 512 * 1024 * 1024 # Skip suspiciously large entries (zip bombs, stray disk images)
+MAX_REPORTED_ISSUES = 100 # Cap the per-file issue list kept in the job result
+
+
+def is_supported_archive(filename: Optional[str]) -> bool:
+    return bool(filename) and filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def infer_doc_type(filename: str) -> str:
+    return EXTENSION_DOC_TYPES.get(os.path.splitext(filename)[1].lower(), 'other')
+
+
+async def spool_upload_to_temp_file(upload_file: UploadFile) -> str:
+    """
+    Copies an uploaded archive to a temporary file in chunks, so large archives
+    never have to fit in memory. Returns the temporary file path; the caller owns it.
+    """
+    suffix = next((ext for ext in ARCHIVE_EXTENSIONS if upload_file.filename.lower().endswith(ext)), "")
+    fd, temp_path = tempfile.mkstemp(prefix="pdm_archive_", suffix=suffix)
+    os.close(fd)
+    try:
+        async with aiofiles.open(temp_path, 'wb') as out_file:
+            while chunk := await upload_file.read(COPY_CHUNK_SIZE):
+                await out_file.write(chunk)
+    except Exception as e:
+        os.remove(temp_path)
+        raise HTTPException(status_code=500, detail=f"Could not store uploaded archive: {e}")
+    finally:
+        await upload_file.close()
+    return temp_path
+
+
+def parse_manifest(content: bytes) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Parses a manifest CSV into {archive path: {'ref', 'type', 'label'}}.
+    Requires a file column and a reference column.
+    """
+    reader = csv.reader(io.StringIO(decode_text_content(content)))
+    header = next(reader, None)
+    if not header or not any(header):
+        raise HTTPException(status_code=400, detail="Manifest header row is empty or missing.")
+
+    normalized_header = [h.strip().lower() for h in header]
+    indices = {}
+    for key, potential_names in MANIFEST_COLUMNS.items():
+        indices[key] = next((normalized_header.index(n) for n in potential_names if n in normalized_header), -1)
+    if indices['file'] == -1 or indices['ref'] == -1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Manifest must have a file column (e.g. {MANIFEST_COLUMNS['file']}) and a reference column (e.g. {MANIFEST_COLUMNS['ref']})."
+        )
+
+    def cell(row: List[str], key: str) -> Optional[str]:
+        idx = indices[key]
+        value = row[idx].strip() if idx != -1 and idx < len(row) else ''
+        return value or None
+
+    entries = {}
+    for row in reader:
+        file_name, ref = cell(row, 'file'), cell(row, 'ref')
+        if not file_name or not ref:
+            continue
+        entries[_normalize_member_name(file_name)] = {
+            'ref': ref, 'type': cell(row, 'type'), 'label': cell(row, 'label')
+        }
+    return entries
+
+
+def _normalize_member_name(name: str) -> str:
+    name = name.replace('\\', '/')
+    while name.startswith('./'):
+        name = name[2:]
+    return name.lstrip('/')
+
+
+def _is_ignored_member(name: str) -> bool:
+    """Skips OS metadata entries such as __MACOSX/ folders and dotfiles."""
+    parts = name.split('/')
+    return parts[0] == '__MACOSX' or any(part.startswith('.') for part in parts if part)
+
+
+class _ArchiveReader:
+    """
+    Minimal common interface over zip and tar archives: list file members,
+    then open them one by one as binary streams without extracting everything.
+    """
+
+    def __init__(self, archive_path: str):
+        if zipfile.is_zipfile(archive_path):
+            self.kind = 'zip'
+            self._zip = zipfile.ZipFile(archive_path)
+            self._members = {
+                _normalize_member_name(info.filename): info
+                for info in self._zip.infolist() if not info.is_dir()
+            }
+        elif tarfile.is_tarfile(archive_path):
+            self.kind = 'tar'
+            self._tar = tarfile.open(archive_path, mode='r:*')
+            self._members = {
+                _normalize_member_name(info.name): info
+                for info in self._tar.getmembers() if info.isfile()
+            }
+        else:
+            raise HTTPException(status_code=400, detail="File is not a valid ZIP or tar archive.")
+
+    @property
+    def workers(self) -> int:
+        # ZipFile supports concurrent member reads; tarfile is a single forward stream.
+        return EXTRACT_WORKERS if self.kind == 'zip' else 1
+
+    def names(self) -> List[str]:
+        return list(self._members)
+
+    def size(self, name: str) -> int:
+        info = self._members[name]
+        return info.file_size if self.kind == 'zip' else info.size
+
+    def open(self, name: str):
+        if self.kind == 'zip':
+            return self._zip.open(self._members[name])
+        return self._tar.extractfile(self._members[name])
+
+    def read(self, name: str) -> bytes:
+        with self.open(name) as member:
+            return member.read()
+
+    def close(self) -> None:
+        (self._zip if self.kind == 'zip' else self._tar).close()
+
+
+def _extract_member(reader: _ArchiveReader, name: str, destination_dir: str) -> str:
+    """
+    Streams one archive member into destination_dir, picking a unique file name
+    the same way save_upload_file does. Runs in a worker thread.
+    """
+    os.makedirs(destination_dir, exist_ok=True)
+    base_name, ext = os.path.splitext(posixpath.basename(name))
+    file_path = os.path.join(destination_dir, base_name + ext)
+    counter = 1
+    while True:
+        try:
+            # O_EXCL reserves the name atomically, so concurrent workers never share a path
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            break
+        except FileExistsError:
+            file_path = os.path.join(destination_dir, f"{base_name}_{counter}{ext}")
+            counter += 1
+
+    try:
+        with os.fdopen(fd, 'wb') as out_file, reader.open(name) as member:
+            shutil.copyfileobj(member, out_file, COPY_CHUNK_SIZE)
+        write_precompressed_variants(file_path)
+    except Exception:
+        if os.path.exists(file_path): # Clean up partial writes
+            os.remove(file_path)
+            remove_precompressed_variants(file_path)
+        raise
+    return file_path
+
+
+async def resolve_product_refs(refs: List[str]) -> Dict[str, int]:
+    """
+    Maps product references to product ids with one query per REF_LOOKUP_CHUNK_SIZE refs.
+    References are not unique; the oldest product wins.
+    """
+    ref_to_id: Dict[str, int] = {}
+    unique_refs = sorted(set(refs))
+    for start in range(0, len(unique_refs), REF_LOOKUP_CHUNK_SIZE):
+        chunk = unique_refs[start:start + REF_LOOKUP_CHUNK_SIZE]
+        rows = await Product.filter(ref__in=chunk).order_by('id').values_list('ref', 'id')
+        for ref, product_id in rows:
+            ref_to_id.setdefault(ref, product_id)
+    return ref_to_id
+
+
+def _plan_entries(
+    names: List[str], manifest: Optional[Dict[str, Dict[str, Optional[str]]]]
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Decides which product reference, type and label each archive member belongs to.
+    Returns (planned entries, names that could not be mapped to a reference).
+    """
+    planned, unmapped = [], []
+    manifest_by_basename = {}
+    if manifest:
+        manifest_by_basename = {posixpath.basename(k): v for k, v in manifest.items()}
+
+    for name in names:
+        base_name = posixpath.basename(name)
+        if manifest is not None:
+            info = manifest.get(name) or manifest_by_basename.get(base_name)
+            if info is None:
+                unmapped.append(name)
+                continue
+            ref, doc_type, label = info['ref'], info['type'], info['label']
+        elif '/' in name:
+            ref, doc_type, label = name.split('/', 1)[0], None, None
+        elif REF_SEPARATOR in base_name:
+            ref, doc_type, label = base_name.split(REF_SEPARATOR, 1)[0], None, None
+        else:
+            unmapped.append(name)
+            continue
+
+        planned.append({
+            'name': name,
+            'ref': ref,
+            'type': doc_type or infer_doc_type(base_name),
+            'label': label or base_name,
+        })
+    return planned, unmapped
+
+
+async def import_documents_from_archive(
+    archive_path: str,
+    media_dir: str,
+    manifest_content: Optional[bytes] = None,
+    job_id: Optional[str] = None,
+    chunk_pause: float = 0,
+) -> Dict[str, Any]:
+    """
+    Attaches every file of a ZIP/tar archive to the product whose `ref` it maps to
+    (see MANIFEST_FILENAME / REF_SEPARATOR). Files are streamed straight from the
+    archive into media_dir and Document rows are inserted with bulk_create,
+    pausing `chunk_pause` seconds between batches to yield the database writer.
+    The archive at archive_path is deleted once processed.
+    Returns a summary of created documents and skipped files.
+    """
+    issues: List[str] = []
+    skipped_count = 0
+    created_count = 0
+    created_ids: List[int] = []
+
+    def record_issue(message: str) -> None:
+        nonlocal skipped_count
+        skipped_count += 1
+        if len(issues) < MAX_REPORTED_ISSUES:
+            issues.append(message)
+
+    reader = None
+    try:
+        reader = await asyncio.to_thread(_ArchiveReader, archive_path)
+        names = [n for n in reader.names() if not _is_ignored_member(n)]
+
+        manifest = None
+        if manifest_content is not None:
+            manifest = parse_manifest(manifest_content)
+        elif MANIFEST_FILENAME in names:
+            manifest = parse_manifest(await asyncio.to_thread(reader.read, MANIFEST_FILENAME))
+        names = [n for n in names if n != MANIFEST_FILENAME]
+
+        planned, unmapped = _plan_entries(names, manifest)
+        for name in unmapped:
+            record_issue(f"{name}: no product reference (use a manifest, '<ref>/file' or '<ref>{REF_SEPARATOR}file')")
+
+        ref_to_id = await resolve_product_refs([entry['ref'] for entry in planned])
+        unmatched_refs = sorted({entry['ref'] for entry in planned if entry['ref'] not in ref_to_id})
+
+        to_extract = []
+        for entry in planned:
+            if entry['ref'] not in ref_to_id:
+                record_issue(f"{entry['name']}: no product with reference '{entry['ref']}'")
+            elif entry['type'] not in DOCUMENT_TYPES:
+                record_issue(f"{entry['name']}: invalid document type '{entry['type']}'")
+            elif reader.size(entry['name']) > MAX_MEMBER_SIZE:
+                record_issue(f"{entry['name']}: larger than {MAX_MEMBER_SIZE} bytes")
+            else:
+                entry['product_id'] = ref_to_id[entry['ref']]
+                to_extract.append(entry)
+
+        if job_id:
+            update_job_progress(job_id, files_total=len(to_extract), files_done=0)
+
+        semaphore = asyncio.Semaphore(reader.workers)
+
+        async def extract(entry: Dict[str, Any]) -> Optional[str]:
+            destination_dir = os.path.join(media_dir, f"product_{entry['product_id']}", entry['type'])
+            async with semaphore:
+                try:
+                    return await asyncio.to_thread(_extract_member, reader, entry['name'], destination_dir)
+                except Exception as e:
+                    record_issue(f"{entry['name']}: could not extract ({e})")
+                    return None
+
+        for start in range(0, len(to_extract), DOCUMENT_BATCH_SIZE):
+            batch = to_extract[start:start + DOCUMENT_BATCH_SIZE]
+            paths = await asyncio.gather(*(extract(entry) for entry in batch))
+
+            documents = [
+                Document(product_id=entry['product_id'], type=entry['type'], path_or_url=path, label=entry['label'])
+                for entry, path in zip(batch, paths) if path is not None
+            ]
+            try:
+                await Document.bulk_create(documents)
+            except Exception:
+                for document in documents: # Don't leave orphaned files behind
+                    if os.path.exists(document.path_or_url):
+                        os.remove(document.path_or_url)
+                        remove_precompressed_variants(document.path_or_url)
+                raise
+            created_count += len(documents)
+            if documents: # bulk_create does not return ids on every backend
+                created_ids.extend(await Document.filter(
+                    path_or_url__in=[document.path_or_url for document in documents]
+                ).values_list("id", flat=True))
+
+            if job_id:
+                update_job_progress(job_id, files_done=start + len(batch), documents_created=created_count)
+            await asyncio.sleep(chunk_pause)
+
+        if created_ids:
+            extraction_service.notify(created_ids) # Index the new files for full-text search
+        return {
+            "files_in_archive": len(names),
+            "documents_created": created_count,
+            "skipped": skipped_count,
+            "unmatched_refs": unmatched_refs[:MAX_REPORTED_ISSUES],
+            "issues": issues,
+        }
+    finally:
+        if reader is not None:
+            reader.close()
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
@@ -0,0 +1,86 @@
+import asyncio
+import traceback
+from typing import Optional
+
+
+class BackgroundService:
+    """
+    Skeleton shared by the background workers (text extraction, URL mirroring, ...):
+    a single task on the serving event loop that runs a pass at start, whenever
+    notify() wakes it and every `scan_interval` seconds (never, if None).
+    Passes never overlap. Subclasses implement run_once().
+    """
+
+    description = "background" # Used in warnings: "<description> pass failed"
+
+    def __init__(self, scan_interval: Optional[float]):
+        self.scan_interval = scan_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = None
+            self._reset_loop_state()
+
+    def _reset_loop_state(self) -> None:
+        """Hook: drops state tied to the previous event loop (semaphores, pooled clients)."""
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run_forever())
+
+    async def start(self) -> None:
+        self._bind_loop()
+        self._ensure_running()
+
+    def notify(self) -> bool:
+        """
+        Wakes the worker for a pass soon; returns False when there is no running loop
+        (e.g. called from a script). Never blocks the caller.
+        """
+        try:
+            self._bind_loop()
+        except RuntimeError:
+            return False
+        self._ensure_running()
+        self._wakeup.set()
+        return True
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _run_forever(self) -> None:
+        periodic = True # The first pass after start is a full one
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._run_pass(periodic)
+            except Exception as e:
+                print(f"Warning: {self.description} pass failed: {e}")
+                traceback.print_exc()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.scan_interval)
+                periodic = False
+            except asyncio.TimeoutError:
+                periodic = True
+
+    async def _run_pass(self, periodic: bool) -> None:
+        """One iteration of the worker loop. `periodic` is True at start and on the scan interval."""
+        await self.run_once()
+
+    async def run_once(self):
+        raise NotImplementedError
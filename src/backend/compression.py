@@ -0,0 +1,383 @@
+import asyncio
+import gzip
+import os
+import time
+from email.utils import parsedate
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from src.backend.background import BackgroundService
+
+# Optional codecs: gzip is always available; brotli and zstd are used when installed
+# (pip install brotli zstandard).
+try:
+    import brotli
+except ImportError: # pragma: no cover - depends on the environment
+    brotli = None
+try:
+    import zstandard
+except ImportError: # pragma: no cover - depends on the environment
+    zstandard = None
+
+# Responses smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = int(os.environ.get("PDM_COMPRESSION_MIN_SIZE", "1024"))
+# Share of one CPU core that on-the-fly compression may use, measured per one-second window.
+# Once spent, responses go out uncompressed until the next window.
+COMPRESSION_CPU_BUDGET = float(os.environ.get("PDM_COMPRESSION_CPU_BUDGET", "0.5"))
+# Bodies above this size are compressed in a worker thread instead of on the event loop
+COMPRESSION_THREAD_THRESHOLD = 256 * 1024
+
+COMPRESSIBLE_MEDIA_TYPES = (
+    "application/json", "application/xml", "application/javascript", "image/svg+xml", "text/",
+)
+# Attachments worth storing precompressed sidecars for (not .xlsx/.xls: already zipped or
+# rarely worth it; a sidecar is only kept when it saves SIDECAR_MIN_SAVING anyway)
+PRECOMPRESS_EXTENSIONS = (".csv", ".txt", ".json", ".xml", ".svg", ".html")
+SIDECAR_MIN_SAVING = 0.1
+# Sidecars live in a hidden folder next to the original, so they can never collide with
+# an uploaded file that happens to be named e.g. "prices.csv.gz"
+SIDECAR_DIRNAME = ".precompressed"
+# Request headers PrecompressedStaticFiles evaluates itself, against the variant it serves
+_CONDITIONAL_HEADERS = (b"if-none-match", b"if-modified-since")
+
+# Codec name -> sidecar suffix, on-the-fly ("fast") and sidecar ("best") compressors; in server preference order
+_CODECS: Dict[str, Dict[str, Any]] = {}
+if zstandard is not None:
+    _CODECS["zstd"] = {
+        "suffix": ".zst",
+        "fast": lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        "best": lambda data: zstandard.ZstdCompressor(level=19).compress(data),
+    }
+if brotli is not None:
+    _CODECS["br"] = {
+        "suffix": ".br",
+        "fast": lambda data: brotli.compress(data, quality=5),
+        "best": lambda data: brotli.compress(data, quality=11),
+    }
+_CODECS["gzip"] = {
+    "suffix": ".gz",
+    "fast": lambda data: gzip.compress(data, compresslevel=6),
+    "best": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+}
+SUPPORTED_ENCODINGS = list(_CODECS)
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Picks the best content coding accepted by the client (q > 0), following the
+    server preference order of SUPPORTED_ENCODINGS. Returns None for identity.
+    """
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+
+    for encoding in available if available is not None else SUPPORTED_ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+class _CpuBudget:
+    """Tracks compression CPU time against COMPRESSION_CPU_BUDGET per one-second window."""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self._window_start = time.monotonic()
+        self._spent = 0.0
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._spent = 0.0
+        return self._spent < self.budget
+
+    def charge(self, seconds: float) -> None:
+        self._spent += seconds
+
+
+class CompressionController:
+    """
+    On-the-fly compression settings, CPU budget and counters shared by CompressionMiddleware
+    (Starlette builds middleware instances itself, so the state lives here).
+    """
+
+    def __init__(self, min_size: int = COMPRESSION_MIN_SIZE, cpu_budget: float = COMPRESSION_CPU_BUDGET):
+        self.min_size = min_size
+        self.budget = _CpuBudget(cpu_budget)
+        self.counters: Dict[str, int] = {
+            "compressed": 0, "skipped_cpu_budget": 0, "bytes_in": 0, "bytes_out": 0,
+        }
+        for encoding in SUPPORTED_ENCODINGS:
+            self.counters[f"encoding_{encoding}"] = 0
+
+    def should_compress(self, status: int, response_headers: Headers, body: bytes) -> bool:
+        # Only complete 200 responses: a 206 body and its Content-Range count identity bytes
+        if status != 200 or "content-range" in response_headers:
+            return False
+        if len(body) < self.min_size or "content-encoding" in response_headers:
+            return False
+        if "no-transform" in response_headers.get("cache-control", "").lower():
+            return False
+        media_type = response_headers.get("content-type", "").split(";")[0].strip().lower()
+        return media_type.startswith(COMPRESSIBLE_MEDIA_TYPES)
+
+    async def compress(self, body: bytes, encoding: str) -> Optional[bytes]:
+        """Compresses `body`, or returns None when the CPU budget for this window is spent."""
+        if not self.budget.allow():
+            self.counters["skipped_cpu_budget"] += 1
+            return None
+
+        compressor: Callable[[bytes], bytes] = _CODECS[encoding]["fast"]
+        if len(body) > COMPRESSION_THREAD_THRESHOLD:
+            started = time.perf_counter()
+            compressed = await asyncio.to_thread(compressor, body)
+            self.budget.charge(time.perf_counter() - started)
+        else:
+            started = time.thread_time()
+            compressed = compressor(body)
+            self.budget.charge(time.thread_time() - started)
+
+        self.counters["compressed"] += 1
+        self.counters[f"encoding_{encoding}"] += 1
+        self.counters["bytes_in"] += len(body)
+        self.counters["bytes_out"] += len(compressed)
+        return compressed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "encodings": SUPPORTED_ENCODINGS,
+            "min_size": self.min_size,
+            "cpu_budget": self.budget.budget,
+            **self.counters,
+        }
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete (single-message) responses of compressible
+    media types with the best coding the client accepts. Streaming responses and
+    responses that already have a Content-Encoding pass through untouched.
+    """
+
+    def __init__(self, app, controller: CompressionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message # Held back until we know whether the body gets compressed
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self.controller.should_compress(
+                start_message["status"], Headers(raw=start_message["headers"]), body
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = await self.controller.compress(body, encoding)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if compressed is None or len(compressed) >= len(body):
+                await send(start_message)
+                await send(message)
+                return
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"): # Not byte-identical to the identity representation
+                headers["ETag"] = "W/" + etag
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _sidecar_path(file_path: str, encoding: str) -> str:
+    directory, filename = os.path.split(file_path)
+    return os.path.join(directory, SIDECAR_DIRNAME, filename + _CODECS[encoding]["suffix"])
+
+
+def write_precompressed_variants(file_path: str) -> List[str]:
+    """
+    Writes gzip (and brotli / zstd when available) copies of a compressible media file
+    at maximum compression, so static downloads never recompress it.
+    Sidecars that do not save at least SIDECAR_MIN_SAVING are not kept.
+    Blocking; call through asyncio.to_thread from async code. Returns the written paths.
+    """
+    if not file_path.lower().endswith(PRECOMPRESS_EXTENSIONS):
+        return []
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return []
+
+    written = []
+    for encoding, codec in _CODECS.items():
+        compressed = codec["best"](data)
+        if len(compressed) > len(data) * (1 - SIDECAR_MIN_SAVING):
+            continue
+        sidecar_path = _sidecar_path(file_path, encoding)
+        os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+        with open(sidecar_path, "wb") as f:
+            f.write(compressed)
+        written.append(sidecar_path)
+    return written
+
+
+def _write_sidecars(file_path: str) -> List[str]:
+    written = write_precompressed_variants(file_path)
+    if written and not os.path.exists(file_path): # Deleted while it was being compressed
+        remove_precompressed_variants(file_path)
+        return []
+    return written
+
+
+class SidecarService(BackgroundService):
+    """
+    Writes precompressed sidecars off the request path: uploads queue their file with
+    notify([path]) and a worker thread compresses queued files one at a time. The queue
+    is in memory only; a file whose sidecars were not written yet is simply served as is.
+    """
+
+    description = "precompressed sidecar"
+
+    def __init__(self):
+        super().__init__(scan_interval=None) # Only works when notified
+        self.counters = {"files": 0, "sidecars_written": 0, "failed": 0}
+        self._pending: Dict[str, None] = {} # Insertion-ordered set of queued paths
+
+    def notify(self, file_paths: Optional[List[str]] = None) -> bool:
+        """Queues files for sidecar generation."""
+        if not super().notify():
+            return False
+        self._pending.update(dict.fromkeys(path for path in file_paths or [] if path.lower().endswith(PRECOMPRESS_EXTENSIONS)))
+        return True
+
+    async def run_once(self) -> int:
+        """Compresses every queued file and returns the number of sidecars written."""
+        self._bind_loop()
+        written = 0
+        async with self._lock:
+            while self._pending:
+                file_path = next(iter(self._pending))
+                del self._pending[file_path]
+                try:
+                    written += len(await asyncio.to_thread(_write_sidecars, file_path))
+                    self.counters["files"] += 1
+                except OSError as e:
+                    self.counters["failed"] += 1
+                    print(f"Warning: Could not write precompressed variants for {file_path}: {e}")
+        self.counters["sidecars_written"] += written
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": len(self._pending), "running": self.running, **self.counters}
+
+
+def remove_precompressed_variants(file_path: str) -> None:
+    """Deletes a file's sidecars, and the sidecar folder once it is empty."""
+    for encoding in _CODECS:
+        sidecar_path = _sidecar_path(file_path, encoding)
+        if os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+    sidecar_dir = os.path.join(os.path.dirname(file_path), SIDECAR_DIRNAME)
+    if os.path.isdir(sidecar_dir) and not os.listdir(sidecar_dir):
+        os.rmdir(sidecar_dir)
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that answers with a precompressed sidecar (see write_precompressed_variants)
+    when the client accepts its coding, keeping the original file's media type.
+    A sidecar is sent with a weak ETag derived from the original's plus the coding, and
+    conditional requests are evaluated against the variant actually served.
+    """
+
+    async def get_response(self, path: str, scope) -> Any:
+        unconditional_scope = dict(scope, headers=[(k, v) for k, v in scope["headers"] if k not in _CONDITIONAL_HEADERS])
+        response = await super().get_response(path, unconditional_scope)
+        if response.status_code != 200 or not isinstance(response, FileResponse):
+            return response
+
+        request_headers = Headers(scope=scope)
+        if "range" not in request_headers: # Byte ranges refer to the original representation
+            original_path = str(response.path)
+            available = [encoding for encoding in _CODECS if os.path.exists(_sidecar_path(original_path, encoding))]
+            encoding = negotiate_encoding(request_headers.get("accept-encoding"), available)
+            if encoding is not None:
+                etag = _opaque_tag(response.headers["etag"])
+                response = FileResponse(
+                    _sidecar_path(original_path, encoding),
+                    media_type=response.media_type,
+                    headers={
+                        "Content-Encoding": encoding,
+                        "Vary": "Accept-Encoding",
+                        "ETag": f'W/{etag[:-1]}-{encoding}"',
+                        "Last-Modified": response.headers["last-modified"], # Same content as the original
+                    },
+                    method=scope["method"],
+                )
+            elif available:
+                response.headers.add_vary_header("Accept-Encoding")
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        """Weak ETag comparison; If-Modified-Since only counts without If-None-Match (RFC 9110)."""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            etag = _opaque_tag(response_headers.get("etag", ""))
+            return any(tag.strip() == "*" or _opaque_tag(tag) == etag for tag in if_none_match.split(","))
+
+        if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+        last_modified = parsedate(response_headers.get("last-modified", ""))
+        return if_modified_since is not None and last_modified is not None and if_modified_since >= last_modified
+
+
+compression_controller = CompressionController()
+sidecar_service = SidecarService()
@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from src.backend.jobs import discard_job, run_job
+
+# Imports compete for SQLite's single writer, so by default only one runs at a time.
+# Override with environment variables when running against a database that allows more.
+IMPORT_WORKERS = int(os.environ.get("PDM_IMPORT_WORKERS", "1"))
+IMPORT_QUEUE_SIZE = int(os.environ.get("PDM_IMPORT_QUEUE_SIZE", "20"))
+IMPORT_RETRY_AFTER_SECONDS = int(os.environ.get("PDM_IMPORT_RETRY_AFTER", "30"))
+
+# Priority classes: lower rank runs first. Bulk feeds also pause longer between
+# committed chunks so they yield the writer to interactive API traffic more often.
+PRIORITY_CLASSES = {
+    "interactive": {"rank": 0, "chunk_pause": 0.01},
+    "nightly": {"rank": 10, "chunk_pause": 0.1},
+}
+DEFAULT_PRIORITY = "interactive"
+
+
+class ImportScheduler:
+    """
+    Bounded priority queue of import jobs drained by a fixed number of worker tasks.
+    Jobs are registered in src.backend.jobs, so clients follow them via GET /jobs/{job_id}.
+    Workers are started lazily on the running event loop at the first submit.
+    """
+
+    def __init__(self, workers: int = IMPORT_WORKERS, max_queued: int = IMPORT_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.running = 0
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sequence = itertools.count() # FIFO order within a priority class
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_queued)
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def is_full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def reject_if_full(self) -> None:
+        """Raises 429 with Retry-After when no more jobs can be queued."""
+        if self.is_full():
+            raise HTTPException(
+                status_code=429,
+                detail="Import queue is full. Please retry later.",
+                headers={"Retry-After": str(IMPORT_RETRY_AFTER_SECONDS)},
+            )
+
+    def submit(self, job_id: str, priority: str, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> None:
+        """
+        Queues `func(*args, **kwargs)` as job `job_id`. `chunk_pause` for the priority class
+        is passed to `func` as a keyword argument. A job that cannot be queued (400/429)
+        is discarded from the registry rather than left pending forever.
+        """
+        try:
+            if priority not in PRIORITY_CLASSES:
+                raise HTTPException(status_code=400, detail=f"Invalid priority. Allowed: {', '.join(PRIORITY_CLASSES)}")
+            self._ensure_started()
+            self.reject_if_full()
+        except HTTPException:
+            discard_job(job_id)
+            raise
+
+        priority_class = PRIORITY_CLASSES[priority]
+        kwargs.setdefault("chunk_pause", priority_class["chunk_pause"])
+        self._queue.put_nowait((priority_class["rank"], next(self._sequence), job_id, func, args, kwargs))
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id, func, args, kwargs = await self._queue.get()
+            self.running += 1
+            try:
+                await run_job(job_id, func, *args, **kwargs)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """Waits until every queued job has finished (used by tests and shutdown)."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self.max_queued,
+        }
+
+
+import_scheduler = ImportScheduler()
@@ -1,10 +1,19 @@
+import asyncio
 import csv
 import io
-from typing import List, Dict, Any, AsyncGenerator
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple
 import openpyxl # For .xlsx files
 from fastapi import HTTPException
+from tortoise.transactions import in_transaction
 
 from src.backend.models import Product, ProductIn_Pydantic # Assuming Pydantic model for creation
+from src.backend.suggest import suggest_index
+from src.backend.sync import CHANGE_UPSERT, record_product_changes
 
 # Define expected column names (case-insensitive matching)
 # These can be customized or made more flexible
@@ -14,6 +23,18 @@ EXPECTED_COLUMNS = {
     'description': ['description', 'desc', 'details', 'product description']
 }
 
+# Rows are written in chunks, one transaction per chunk. Between chunks the import
+# pauses briefly so API requests can get SQLite's single writer; this bounds how
+# long an interactive write waits behind a running import.
+IMPORT_CHUNK_SIZE = 200
+IMPORT_CHUNK_PAUSE_SECONDS = 0.01
+
+# Worksheets are parsed in worker processes (openpyxl parsing is CPU bound), several
+# sheets at a time; the parsed rows still go through the single chunked writer.
+IMPORT_PARSE_WORKERS = int(os.environ.get("PDM_IMPORT_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
 def find_column_indices(header: List[str]) -> Dict[str, int]:
     """
     Identifies the indices of expected columns in the header row.
@@ -42,49 +63,90 @@ def find_column_indices(header: List[str]) -> Dict[str, int]:
         )
     return indices
 
-async def parse_excel_file(file_content: bytes) -> AsyncGenerator[Dict[str, Any], None]:
+def decode_text_content(file_content: bytes) -> str:
     """
-    Parses an Excel file (.xlsx) content and yields rows as dictionaries.
+    Decodes CSV-like text content, trying UTF-8 (with and without BOM) before falling back to latin-1.
     """
     try:
-        workbook = openpyxl.load_workbook(io.BytesIO(file_content), read_only=True)
-        sheet = workbook.active
-
-        if sheet is None:
-            raise HTTPException(status_code=400, detail="No active sheet found in Excel file.")
-
-        header_cells = sheet[1] # First row as header
-        header = [cell.value for cell in header_cells]
-        if not header or not any(h for h in header if h is not None): # Check if all header cells are None or empty
-             raise HTTPException(status_code=400, detail="Excel file header row is empty or missing.")
+        return file_content.decode('utf-8-sig') # UTF-8 with BOM
+    except UnicodeDecodeError:
+        try:
+            return file_content.decode('utf-8')
+        except UnicodeDecodeError:
+            return file_content.decode('latin-1') # Fallback
+
+def _parse_data_row(row, col_indices: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    """Maps a data row to product fields using the header's column indices; None without a name."""
+    def cell(key):
+        index = col_indices.get(key, -1)
+        return row[index] if index != -1 and index < len(row) else None
+
+    name_val = cell('name')
+    if not name_val:
+        return None
+    product_data = {'name': str(name_val)}
+    if cell('ref') is not None:
+        product_data['ref'] = str(cell('ref'))
+    if cell('description') is not None:
+        product_data['description'] = str(cell('description'))
+    return product_data
+
+def list_excel_sheets(path: str) -> List[str]:
+    """Names of the worksheets of an .xlsx file, in workbook order."""
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
 
-        col_indices = find_column_indices(header)
+def parse_excel_sheet(path: str, sheet_name: str) -> Dict[str, Any]:
+    """
+    Parses one worksheet of an .xlsx file, detecting its header row's columns.
+    Runs in a worker process, so problems are returned per sheet instead of raised:
+    {"rows": [product dicts], "error": None or message}.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None) # First row as header
+        if not header or not any(h for h in header if h is not None):
+            return {"rows": [], "error": "Header row is empty or missing."}
+        try:
+            col_indices = find_column_indices(list(header))
+        except HTTPException as e:
+            return {"rows": [], "error": e.detail}
 
-        for row_idx, row_cells in enumerate(sheet.iter_rows(min_row=2)): # Skip header
-            row = [cell.value for cell in row_cells]
+        products = []
+        for row_idx, row in enumerate(rows):
             if not any(c for c in row if c is not None): # Skip if all cells in row are None
                 continue
-
-            product_data = {}
-            # Use .get(col_indices['name']) to safely access, check if index is valid first
-            name_val = row[col_indices['name']] if col_indices.get('name', -1) != -1 and col_indices['name'] < len(row) else None
-
-            if not name_val:
-                print(f"Skipping Excel row {row_idx + 2} due to missing product name.")
+            product_data = _parse_data_row(row, col_indices)
+            if product_data is None:
+                print(f"Skipping row {row_idx + 2} of sheet '{sheet_name}' due to missing product name.")
                 continue
+            products.append(product_data)
+        return {"rows": products, "error": None}
+    except Exception as e:
+        return {"rows": [], "error": f"Error parsing Excel sheet: {e}"}
+    finally:
+        workbook.close()
 
-            product_data['name'] = str(name_val)
-            if col_indices.get('ref', -1) != -1 and col_indices['ref'] < len(row) and row[col_indices['ref']] is not None:
-                product_data['ref'] = str(row[col_indices['ref']])
-            if col_indices.get('description', -1) != -1 and col_indices['description'] < len(row) and row[col_indices['description']] is not None:
-                product_data['description'] = str(row[col_indices['description']])
+def _write_file(path: str, content: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(content)
 
-            yield product_data
+def _parse_executor() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        # spawn: workers must not inherit the event loop or open database connections
+        _parse_pool = ProcessPoolExecutor(max_workers=max(1, IMPORT_PARSE_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+    return _parse_pool
 
-    except HTTPException: # Re-raise HTTPException
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error parsing Excel file: {e}")
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
 
 
 async def parse_csv_file(file_content: bytes) -> AsyncGenerator[Dict[str, Any], None]:
@@ -92,14 +154,7 @@ async def parse_csv_file(file_content: bytes) -> AsyncGenerator[Dict[str, Any],
     Parses a CSV file content and yields rows as dictionaries.
     """
     try:
-        try:
-            content_str = file_content.decode('utf-8-sig') # UTF-8 with BOM
-        except UnicodeDecodeError:
-            try:
-                content_str = file_content.decode('utf-8')
-            except UnicodeDecodeError:
-                content_str = file_content.decode('latin-1') # Fallback
-
+        content_str = decode_text_content(file_content)
         reader = csv.reader(io.StringIO(content_str))
         header = next(reader, None)
 
@@ -112,19 +167,11 @@ async def parse_csv_file(file_content: bytes) -> AsyncGenerator[Dict[str, Any],
             if not any(row):
                 continue
 
-            product_data = {}
-            name_val = row[col_indices['name']] if col_indices.get('name', -1) != -1 and col_indices['name'] < len(row) else None
-
-            if not name_val:
+            product_data = _parse_data_row(row, col_indices)
+            if product_data is None:
                 print(f"Skipping CSV row {row_idx + 2} due to missing product name.")
                 continue
 
-            product_data['name'] = str(name_val)
-            if col_indices.get('ref', -1) != -1 and col_indices['ref'] < len(row) and row[col_indices['ref']] is not None:
-                product_data['ref'] = str(row[col_indices['ref']])
-            if col_indices.get('description', -1) != -1 and col_indices['description'] < len(row) and row[col_indices['description']] is not None:
-                product_data['description'] = str(row[col_indices['description']])
-
             yield product_data
 
     except HTTPException: # Re-raise HTTPException
@@ -135,67 +182,184 @@ async def parse_csv_file(file_content: bytes) -> AsyncGenerator[Dict[str, Any],
         raise HTTPException(status_code=400, detail=f"Error parsing CSV file: {e}")
 
 
-async def import_products_from_file_content(file_content: bytes, filename: str) -> Dict[str, Any]:
+async def _import_product_row(product_data: Dict[str, Any]) -> Tuple[str, Product]:
     """
-    Orchestrates parsing and importing products using get_or_create.
-    Returns a summary of imported/created and updated/skipped products.
+    Creates or updates a single product by name.
+    Returns ('created' | 'updated' | 'skipped', product).
     """
-    created_count = 0
-    updated_count = 0
-    skipped_count = 0 # For rows with errors or missing mandatory fields after header processing
-
-    if filename.endswith('.xlsx'):
-        parser = parse_excel_file(file_content)
-    elif filename.endswith('.csv'):
-        parser = parse_csv_file(file_content)
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported file type. Only .xlsx and .csv are supported.")
-
-    async for product_data in parser:
-        try:
-            # ProductIn_Pydantic might be useful here if you have complex validation/defaults
-            # that are not directly mapped from columns or need pre-processing.
-            # For simple cases, direct dict is fine.
-
-            product_defaults = {
-                'ref': product_data.get('ref'),
-                'description': product_data.get('description')
-            }
-            # Filter out None values from defaults to avoid overwriting existing fields with None
-            product_defaults = {k: v for k, v in product_defaults.items() if v is not None}
-
-            obj, created = await Product.get_or_create(
-                name=product_data['name'],
-                defaults=product_defaults
-            )
-
-            if created:
-                created_count += 1
+    # ProductIn_Pydantic might be useful here if you have complex validation/defaults
+    # that are not directly mapped from columns or need pre-processing.
+    # For simple cases, direct dict is fine.
+
+    product_defaults = {
+        'ref': product_data.get('ref'),
+        'description': product_data.get('description')
+    }
+    # Filter out None values from defaults to avoid overwriting existing fields with None
+    product_defaults = {k: v for k, v in product_defaults.items() if v is not None}
+
+    obj, created = await Product.get_or_create(
+        name=product_data['name'],
+        defaults=product_defaults
+    )
+
+    if created:
+        return 'created', obj
+
+    # If not created, it means product with this name already existed.
+    # Update it with new data if provided, only if different.
+    updated = False
+    if product_defaults.get('ref') is not None and obj.ref != product_defaults['ref']:
+        obj.ref = product_defaults['ref']
+        updated = True
+    if product_defaults.get('description') is not None and obj.description != product_defaults['description']:
+        obj.description = product_defaults['description']
+        updated = True
+
+    if updated:
+        await obj.save()
+        return 'updated', obj
+    # Name matched, and other fields were either not provided or same as existing.
+    # Consider this as "skipped" in terms of no change made.
+    return 'skipped', obj
+
+
+async def import_products_from_file_content(
+    file_content: bytes,
+    filename: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    chunk_pause: float = IMPORT_CHUNK_PAUSE_SECONDS,
+    sheets: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Imports products from one .xlsx or .csv file; see import_products_from_files.
+    """
+    return await import_products_from_files([(filename, file_content)], sheets=sheets, chunk_size=chunk_size, chunk_pause=chunk_pause)
+
+
+async def import_products_from_files(
+    files: List[Tuple[str, bytes]],
+    sheets: Optional[List[str]] = None,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    chunk_pause: float = IMPORT_CHUNK_PAUSE_SECONDS,
+) -> Dict[str, Any]:
+    """
+    Orchestrates parsing and importing products using get_or_create, from any number of
+    (filename, content) .xlsx / .csv files. Every worksheet of a workbook is imported,
+    or only those named in `sheets`; each sheet has its own header row.
+    Sheets are parsed in parallel worker processes and consumed in file and sheet order.
+    Rows are committed `chunk_size` at a time (each chunk in one transaction,
+    together with its sync change log entries), sleeping `chunk_pause` seconds between chunks.
+    A sheet (or CSV file) that cannot be parsed is reported and skipped; if none can, the import fails.
+    Returns a summary of imported/created and updated/skipped products, overall and per sheet.
+    """
+    for filename, _ in files:
+        if not (filename.endswith('.xlsx') or filename.endswith('.csv')):
+            raise HTTPException(status_code=400, detail="Unsupported file type. Only .xlsx and .csv are supported.")
+
+    counts = {'created': 0, 'updated': 0, 'skipped': 0}
+    sources: List[Dict[str, Any]] = [] # One per CSV file or selected worksheet, in import order
+    source_files: List[int] = [] # Index in `files` of each source
+    futures: List[Optional[asyncio.Future]] = [] # Sheet parse results, parallel to sources (None for CSV)
+    temp_dir = tempfile.mkdtemp(prefix="pdm-import-")
+
+    async def write_chunk(rows: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+        changed = []
+        async with in_transaction():
+            for source, product_data in rows:
+                try:
+                    outcome, product = await _import_product_row(product_data)
+                except Exception as e:
+                    print(f"Error processing product {product_data.get('name', 'Unknown Name')}: {e}")
+                    outcome = 'skipped'
+                counts[outcome] += 1
+                source[outcome] += 1
+                if outcome != 'skipped':
+                    changed.append(product)
+            await record_product_changes([p.id for p in changed], CHANGE_UPSERT)
+        suggest_index.upsert_many([(p.id, p.name, p.ref) for p in changed]) # Only once the chunk is committed
+
+    chunk: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    try:
+        # Workbooks go to a temporary file each, so worker processes read them from disk
+        workbooks = {}
+        for index, (filename, file_content) in enumerate(files):
+            if filename.endswith('.xlsx'):
+                path = os.path.join(temp_dir, f"{index}.xlsx")
+                await asyncio.to_thread(_write_file, path, file_content)
+                try:
+                    workbooks[index] = (path, await asyncio.to_thread(list_excel_sheets, path))
+                except Exception as e:
+                    raise HTTPException(status_code=400, detail=f"Error parsing Excel file {filename}: {e}")
+
+        if sheets:
+            available = {name for _, names in workbooks.values() for name in names}
+            missing = [name for name in sheets if name not in available]
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Sheet(s) not found: {', '.join(missing)}")
+
+        for index, (filename, _) in enumerate(files):
+            sheet_names = workbooks[index][1] if index in workbooks else [None]
+            for name in sheet_names:
+                if name is None or not sheets or name in sheets:
+                    sources.append({"file": filename, "sheet": name, "created": 0, "updated": 0, "skipped": 0, "error": None})
+                    source_files.append(index)
+
+        # Every sheet is submitted up front; a single sheet is not worth a worker process
+        loop = asyncio.get_running_loop()
+        parallel = sum(1 for source in sources if source["sheet"] is not None) > 1
+        for source, index in zip(sources, source_files):
+            if source["sheet"] is None:
+                futures.append(None)
+                continue
+            path = workbooks[index][0]
+            if parallel:
+                futures.append(loop.run_in_executor(_parse_executor(), parse_excel_sheet, path, source["sheet"]))
             else:
-                # If not created, it means product with this name already existed.
-                # Update it with new data if provided, only if different.
-                updated = False
-                if product_defaults.get('ref') is not None and obj.ref != product_defaults['ref']:
-                    obj.ref = product_defaults['ref']
-                    updated = True
-                if product_defaults.get('description') is not None and obj.description != product_defaults['description']:
-                    obj.description = product_defaults['description']
-                    updated = True
-
-                if updated:
-                    await obj.save()
-                    updated_count += 1
-                else:
-                    # Name matched, and other fields were either not provided or same as existing.
-                    # Consider this as "skipped" in terms of no change made.
-                    skipped_count +=1
-
-        except HTTPException as e: # If parser yields an error wrapped in HTTPException
-            print(f"Skipping a row due to parsing error before DB: {e.detail}")
-            skipped_count += 1
-        except Exception as e:
-            print(f"Error processing product {product_data.get('name', 'Unknown Name')}: {e}")
-            skipped_count += 1
-
-    return {"created": created_count, "updated": updated_count, "skipped_due_to_error_or_no_change": skipped_count}
+                futures.append(asyncio.ensure_future(asyncio.to_thread(parse_excel_sheet, path, source["sheet"])))
+
+        async def add(source: Dict[str, Any], product_data: Dict[str, Any]) -> None:
+            nonlocal chunk
+            chunk.append((source, product_data))
+            if len(chunk) >= chunk_size:
+                await write_chunk(chunk)
+                chunk = []
+                await asyncio.sleep(chunk_pause) # Let queued API writes through
+
+        for source, index, future in zip(sources, source_files, futures):
+            if future is None:
+                content = files[index][1]
+                try:
+                    async for product_data in parse_csv_file(content):
+                        await add(source, product_data)
+                except HTTPException as e: # Rows parsed before the error are still imported
+                    source["error"] = e.detail
+                continue
 
+            result = await future
+            if result["error"]:
+                source["error"] = result["error"]
+                continue
+            for product_data in result["rows"]:
+                await add(source, product_data)
+    finally:
+        if chunk: # Rows parsed before an error are still imported
+            await write_chunk(chunk)
+        for future in futures:
+            if future is not None:
+                future.cancel()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if sources and all(source["error"] for source in sources):
+        detail = sources[0]["error"] if len(sources) == 1 else "; ".join(
+            f"{source['file']}" + (f" [{source['sheet']}]" if source["sheet"] is not None else "") + f": {source['error']}"
+            for source in sources
+        )
+        raise HTTPException(status_code=400, detail=detail)
+
+    return {
+        "created": counts['created'],
+        "updated": counts['updated'],
+        "skipped_due_to_error_or_no_change": counts['skipped'],
+        "sheets": sources,
+    }
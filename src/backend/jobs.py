@@ -0,0 +1,103 @@
+import traceback
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# In-memory registry of background jobs (archive ingestion, imports, ...).
+# Jobs are tracked per API process and are lost on restart; clients poll
+# GET /jobs/{job_id} to follow progress.
+JOBS: Dict[str, Dict[str, Any]] = {}
+
+# Finished jobs are kept around so clients can read their result, but the
+# registry is bounded so a long-running server does not grow without limit.
+MAX_FINISHED_JOBS = 500
+
+JOB_STATUS_PENDING = "pending"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_COMPLETED = "completed"
+JOB_STATUS_FAILED = "failed"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _prune_finished_jobs() -> None:
+    """Drops the oldest finished jobs once the registry exceeds MAX_FINISHED_JOBS."""
+    finished = [
+        job for job in JOBS.values()
+        if job["status"] in (JOB_STATUS_COMPLETED, JOB_STATUS_FAILED)
+    ]
+    overflow = len(finished) - MAX_FINISHED_JOBS
+    if overflow <= 0:
+        return
+    finished.sort(key=lambda job: job["finished_at"] or "")
+    for job in finished[:overflow]:
+        JOBS.pop(job["id"], None)
+
+
+def create_job(kind: str, **details: Any) -> str:
+    """
+    Registers a new pending job and returns its id.
+    `details` is free-form metadata shown to clients (e.g. the uploaded filename).
+    """
+    job_id = uuid.uuid4().hex
+    JOBS[job_id] = {
+        "id": job_id,
+        "kind": kind,
+        "status": JOB_STATUS_PENDING,
+        "details": details,
+        "progress": {},
+        "result": None,
+        "error": None,
+        "created_at": _now(),
+        "started_at": None,
+        "finished_at": None,
+    }
+    return job_id
+
+
+def discard_job(job_id: str) -> None:
+    """Removes a job that never got to run (e.g. it could not be queued)."""
+    JOBS.pop(job_id, None)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return JOBS.get(job_id)
+
+
+def list_jobs(kind: Optional[str] = None) -> List[Dict[str, Any]]:
+    jobs = [job for job in JOBS.values() if kind is None or job["kind"] == kind]
+    return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+
+def update_job_progress(job_id: str, **progress: Any) -> None:
+    """Merges progress counters into a job. Unknown job ids are ignored."""
+    job = JOBS.get(job_id)
+    if job is not None:
+        job["progress"].update(progress)
+
+
+async def run_job(job_id: str, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> None:
+    """
+    Runs `func(*args, **kwargs)` as the body of job `job_id`, recording its
+    status, result or error. Called by the ImportScheduler workers.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        return
+
+    job["status"] = JOB_STATUS_RUNNING
+    job["started_at"] = _now()
+    try:
+        job["result"] = await func(*args, **kwargs)
+        job["status"] = JOB_STATUS_COMPLETED
+    except Exception as e:
+        detail = getattr(e, "detail", None) or str(e) # HTTPException carries its message in .detail
+        print(f"Job {job_id} ({job['kind']}) failed: {detail}")
+        traceback.print_exc()
+        job["error"] = detail
+        job["status"] = JOB_STATUS_FAILED
+    finally:
+        job["finished_at"] = _now()
+        _prune_finished_jobs()
@@ -1,22 +1,33 @@
+import mimetypes
 import os
 import shutil # For file operations
+from collections import defaultdict
 from typing import List, Optional
 
 import aiofiles # For async file operations
-from fastapi import APIRouter, FastAPI, File, HTTPException, UploadFile, Form, Query, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles # To serve media files
+from fastapi import APIRouter, FastAPI, File, HTTPException, UploadFile, Form, Query
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware # Added for CORS
 from pydantic import BaseModel
 
-from src.backend.import_utils import import_products_from_file_content # For bulk import
+from src.backend.import_utils import import_products_from_file_content, import_products_from_files, shutdown_parse_pool # For bulk import
+from src.backend.archive_import import ARCHIVE_EXTENSIONS, import_documents_from_archive, is_supported_archive, spool_upload_to_temp_file
+from src.backend.jobs import create_job, get_job, list_jobs
+from src.backend.import_scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, import_scheduler
+from src.backend.admission import AdmissionControlMiddleware, admission_controller
+from src.backend.mirroring import is_remote_url, mirror_service
+from src.backend.search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, extraction_service, search_documents
+from src.backend.compression import CompressionMiddleware, PrecompressedStaticFiles, compression_controller, remove_precompressed_variants, sidecar_service
+from src.backend.suggest import DEFAULT_SUGGEST_LIMIT, MAX_SUGGEST_LIMIT, suggest_index
+from src.backend.sync import CHANGE_DELETE, CHANGE_UPSERT, DEFAULT_CHANGES_LIMIT, MAX_CHANGES_LIMIT, backfill_product_changes, fetch_product_changes, record_product_changes
 
 from tortoise.contrib.fastapi import register_tortoise
 from tortoise.exceptions import DoesNotExist, IntegrityError
 from tortoise.expressions import Q # Make sure Q is imported for search queries
+from tortoise import timezone
 
 # Import models and Pydantic schemas
-from src.backend.models import Document, Product, Document_Pydantic, DocumentIn_Pydantic, Product_Pydantic, ProductIn_Pydantic
+from src.backend.models import DOCUMENT_TYPES, Document, DocumentMirror, Product, Document_Pydantic, DocumentIn_Pydantic, Product_Pydantic, ProductIn_Pydantic
 app = FastAPI()
 
 @app.get("/")
@@ -35,6 +46,13 @@ app = FastAPI(
     version="0.1.0"
 )
 
+# Response compression (zstd / brotli / gzip negotiation, size threshold, CPU budget)
+app.add_middleware(CompressionMiddleware, controller=compression_controller)
+
+# Admission control for upload routes (503 + Retry-After under upload bursts).
+# Added before CORS so that CORS stays the outermost layer and rejections carry CORS headers.
+app.add_middleware(AdmissionControlMiddleware, controller=admission_controller)
+
 # CORS Middleware Configuration
 # This should be placed before routers and static file mounts if possible,
 # though FastAPI is generally flexible.
@@ -46,8 +64,8 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
-# Mount static directory to serve media files
-app.mount("/media", StaticFiles(directory=BASE_MEDIA_DIR), name="media")
+# Mount static directory to serve media files (precompressed sidecars are served when accepted)
+app.mount("/media", PrecompressedStaticFiles(directory=BASE_MEDIA_DIR), name="media")
 
 # Tortoise ORM Configuration (same as before)
 TORTOISE_ORM = {
@@ -60,6 +78,22 @@ TORTOISE_ORM = {
     },
 }
 
+# Stop import workers on shutdown (queued jobs are in memory and are dropped)
+app.add_event_handler("shutdown", import_scheduler.shutdown)
+app.add_event_handler("shutdown", shutdown_parse_pool)
+# Document text extraction resumes at startup with whatever is new or changed
+app.add_event_handler("startup", extraction_service.start)
+app.add_event_handler("shutdown", extraction_service.shutdown)
+# Precompressed sidecars of uploads are written by a background worker
+app.add_event_handler("shutdown", sidecar_service.shutdown)
+# URL documents are mirrored locally in the background (closes the pooled HTTP client on shutdown)
+app.add_event_handler("startup", mirror_service.start)
+app.add_event_handler("shutdown", mirror_service.shutdown)
+# Products that predate the sync change log get an upsert row, so a full sync sees them
+app.add_event_handler("startup", backfill_product_changes)
+# Typeahead prefix index is built once from the database, then kept current by the write paths
+app.add_event_handler("startup", suggest_index.load)
+
 register_tortoise(
     app,
     config=TORTOISE_ORM,
@@ -80,6 +114,8 @@ async def create_product(product_in: ProductIn_Pydantic):
         product = await Product.create(**product_in.model_dump(exclude_unset=True))
     except IntegrityError as e: # Catch potential unique constraint violations if any
         raise HTTPException(status_code=400, detail=f"Database integrity error: {e}")
+    await record_product_changes([product.id], CHANGE_UPSERT)
+    suggest_index.upsert(product.id, product.name, product.ref)
     return await Product_Pydantic.from_tortoise_orm(product)
 
 @product_router.get("/", response_model=List[Product_Pydantic])
@@ -101,6 +137,98 @@ async def list_products(
 class ProductWithDocuments(Product_Pydantic):
     documents: List[Document_Pydantic] = []
 
+# Upper bound on ids per batch request (keeps the IN (...) clauses below SQLite's variable limit)
+MAX_BATCH_PRODUCT_IDS = 500
+
+class ProductBatchRequest(BaseModel):
+    ids: List[int]
+
+async def fetch_products_with_documents(product_ids: List[int]) -> List[ProductWithDocuments]:
+    """
+    Loads many products and their documents in exactly two queries, grouping
+    documents by product_id in a single pass. Results follow the order of
+    `product_ids`; unknown ids are left out.
+    """
+    if len(product_ids) > MAX_BATCH_PRODUCT_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many product ids. Maximum per request: {MAX_BATCH_PRODUCT_IDS}")
+
+    unique_ids = list(dict.fromkeys(product_ids)) # De-duplicate, keep request order
+    if not unique_ids:
+        return []
+
+    products = await Product.filter(id__in=unique_ids)
+    documents = await Document.filter(product_id__in=unique_ids).order_by('id')
+
+    docs_by_product = defaultdict(list)
+    for doc in documents:
+        docs_by_product[doc.product_id].append(Document_Pydantic.model_validate(doc))
+
+    products_by_id = {p.id: p for p in products}
+    return [
+        ProductWithDocuments(
+            **Product_Pydantic.model_validate(products_by_id[product_id]).model_dump(),
+            documents=docs_by_product[product_id]
+        )
+        for product_id in unique_ids if product_id in products_by_id
+    ]
+
+@product_router.get("/batch", response_model=List[ProductWithDocuments])
+async def get_products_batch(
+    ids: str = Query(..., description="Comma-separated product ids, e.g. 1,2,3")
+):
+    """
+    Retrieve many products at once, each including its associated documents.
+    Ids that do not exist are omitted from the response.
+    """
+    try:
+        product_ids = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ids. Expected comma-separated integers.")
+    return await fetch_products_with_documents(product_ids)
+
+@product_router.post("/batch", response_model=List[ProductWithDocuments])
+async def post_products_batch(batch: ProductBatchRequest):
+    """
+    Same as `GET /products/batch`, with the ids sent in the request body
+    (useful for long id lists that do not fit comfortably in a URL).
+    """
+    return await fetch_products_with_documents(batch.ids)
+
+class ProductChangesPage(BaseModel):
+    changed: List[Product_Pydantic]
+    deleted: List[int]
+    next_cursor: int
+    has_more: bool
+
+@product_router.get("/changes", response_model=ProductChangesPage)
+async def list_product_changes(
+    since: int = Query(0, ge=0, description="Cursor returned as next_cursor by the previous call (0 for a full sync)"),
+    limit: int = Query(DEFAULT_CHANGES_LIMIT, ge=1, le=MAX_CHANGES_LIMIT, description="Maximum number of change log entries to consume")
+):
+    """
+    Incremental sync feed. Returns products created or updated since the cursor
+    and the ids of products deleted since then (tombstones).
+    Keep calling with `since=next_cursor` while `has_more` is true.
+    """
+    return await fetch_product_changes(since, limit)
+
+class ProductSuggestion(BaseModel):
+    id: int
+    name: str
+    ref: Optional[str] = None
+
+@product_router.get("/suggest", response_model=List[ProductSuggestion])
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100, description="What the user typed so far"),
+    limit: int = Query(DEFAULT_SUGGEST_LIMIT, ge=1, le=MAX_SUGGEST_LIMIT, description="Maximum number of suggestions")
+):
+    """
+    Typeahead suggestions: products whose name, reference or a word of the name
+    starts with `q` (case and accent insensitive), served from an in-memory index.
+    """
+    await suggest_index.ensure_loaded()
+    return suggest_index.suggest(q, limit)
+
 @product_router.get("/{product_id}", response_model=ProductWithDocuments)
 async def get_product(product_id: int):
     """
@@ -128,12 +256,15 @@ async def update_product(product_id: int, product_in: ProductIn_Pydantic):
     Update an existing product.
     """
     try:
-        await Product.filter(id=product_id).update(**product_in.model_dump(exclude_unset=True))
+        # Queryset updates bypass auto_now, so bump updated_at explicitly
+        await Product.filter(id=product_id).update(**product_in.model_dump(exclude_unset=True), updated_at=timezone.now())
         product = await Product.get(id=product_id) # Fetch the updated product
     except DoesNotExist:
         raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"Database integrity error: {e}")
+    await record_product_changes([product.id], CHANGE_UPSERT)
+    suggest_index.upsert(product.id, product.name, product.ref)
     return await Product_Pydantic.from_tortoise_orm(product)
 
 @product_router.delete("/{product_id}", response_model=dict)
@@ -156,6 +287,7 @@ async def delete_product(product_id: int):
             if os.path.exists(doc.path_or_url):
                 try:
                     os.remove(doc.path_or_url)
+                    remove_precompressed_variants(doc.path_or_url)
                     # Try to remove empty parent directories
                     parent_dir = os.path.dirname(doc.path_or_url)
                     if parent_dir != BASE_MEDIA_DIR and not os.listdir(parent_dir): # product_X/type
@@ -172,6 +304,10 @@ async def delete_product(product_id: int):
     if not deleted_count:
         # Should not happen if retrieval was successful
         raise HTTPException(status_code=404, detail=f"Product {product_id} not found during deletion attempt")
+    await record_product_changes([product_id], CHANGE_DELETE) # Tombstone for sync clients
+    suggest_index.remove(product_id)
+    extraction_service.notify([doc.id for doc in docs_to_delete]) # Drops the product's documents from the search index
+    mirror_service.notify() # Removes local copies of its URL documents
 
     return {"message": f"Product {product_id} and its associated documents and files deleted successfully"}
 
@@ -209,6 +345,10 @@ async def save_upload_file(upload_file: UploadFile, product_id: int, doc_type: s
     finally:
         await upload_file.close()
 
+    # Precompressed sidecars for text-heavy attachments, so /media downloads never recompress.
+    # Max-level compression is slow: it runs in the background, not before the upload responds.
+    sidecar_service.notify([file_path])
+
     return file_path # Path relative to project root, e.g., "media/product_1/pdf/report.pdf"
 
 @document_router.post("/upload/product/{product_id}", response_model=Document_Pydantic)
@@ -223,9 +363,8 @@ async def upload_document_for_product(
     except DoesNotExist:
         raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
 
-    allowed_doc_types = ["excel", "image", "pdf", "other"] # Add more specific types if needed
-    if doc_type not in allowed_doc_types:
-        raise HTTPException(status_code=400, detail=f"Invalid document type. Allowed: {', '.join(allowed_doc_types)}")
+    if doc_type not in DOCUMENT_TYPES: # Add more specific types in models.DOCUMENT_TYPES if needed
+        raise HTTPException(status_code=400, detail=f"Invalid document type. Allowed: {', '.join(DOCUMENT_TYPES)}")
 
     saved_file_path = await save_upload_file(file, product_id, doc_type)
 
@@ -239,8 +378,10 @@ async def upload_document_for_product(
     except IntegrityError as e:
         if os.path.exists(saved_file_path): # Cleanup uploaded file if DB fails
             os.remove(saved_file_path)
+            remove_precompressed_variants(saved_file_path)
         raise HTTPException(status_code=400, detail=f"DB error creating document: {e}")
 
+    extraction_service.notify([document.id]) # Text extraction for search happens in the background
     return await Document_Pydantic.from_tortoise_orm(document)
 
 @document_router.post("/url/product/{product_id}", response_model=Document_Pydantic)
@@ -257,6 +398,8 @@ async def add_document_url_for_product(
 
     if not (url.startswith("http://") or url.startswith("https://")): # Basic URL validation
         raise HTTPException(status_code=400, detail="Invalid URL. Must start with http:// or https://")
+    if doc_type not in DOCUMENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid document type. Allowed: {', '.join(DOCUMENT_TYPES)}")
 
     try:
         document = await Document.create(
@@ -265,8 +408,52 @@ async def add_document_url_for_product(
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail=f"DB error creating document URL: {e}")
 
+    mirror_service.notify() # Fetches a local copy in the background
     return await Document_Pydantic.from_tortoise_orm(document)
 
+@document_router.post("/upload/archive", summary="Bulk Upload Documents from a ZIP/tar Archive")
+async def upload_documents_archive(
+    archive: UploadFile = File(..., description="ZIP or tar archive of documents."),
+    manifest: Optional[UploadFile] = File(None, description="Optional CSV manifest with file, reference, type and label columns."),
+    priority: str = Query(DEFAULT_PRIORITY, description=f"Scheduling class: {', '.join(PRIORITY_CLASSES)}")
+):
+    """
+    Attach many documents at once. The archive is queued on the import scheduler
+    (429 with Retry-After when the queue is full); poll `GET /jobs/{job_id}` for
+    progress and the final summary.
+
+    Each file is attached to the product whose **Reference** matches, using either:
+    - a manifest (uploaded alongside, or `manifest.csv` at the archive root), or
+    - the naming convention `<ref>/<filename>` or `<ref>__<filename>`.
+
+    The document type is taken from the manifest or guessed from the file extension.
+    """
+    if not is_supported_archive(archive.filename):
+        raise HTTPException(status_code=400, detail=f"Invalid archive type. Allowed: {', '.join(ARCHIVE_EXTENSIONS)}")
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority. Allowed: {', '.join(PRIORITY_CLASSES)}")
+
+    import_scheduler.reject_if_full() # Fail fast, before spooling a large upload
+
+    manifest_content = None
+    if manifest is not None:
+        manifest_content = await manifest.read()
+        await manifest.close()
+
+    archive_path = await spool_upload_to_temp_file(archive)
+
+    job_id = create_job("document_archive", filename=archive.filename, priority=priority)
+    try:
+        import_scheduler.submit(
+            job_id, priority, import_documents_from_archive,
+            archive_path, BASE_MEDIA_DIR, manifest_content, job_id
+        )
+    except HTTPException: # The scheduler already discarded the job
+        os.remove(archive_path)
+        raise
+
+    return {"job_id": job_id, "message": f"Archive '{archive.filename}' received. Documents are being attached in the background."}
+
 @document_router.get("/product/{product_id}", response_model=List[Document_Pydantic])
 async def list_documents_for_product(product_id: int):
     if not await Product.exists(id=product_id):
@@ -275,6 +462,25 @@ async def list_documents_for_product(product_id: int):
     documents = await Document.filter(product_id=product_id).all()
     return [await Document_Pydantic.from_tortoise_orm(doc) for doc in documents]
 
+class DocumentSearchResult(BaseModel):
+    document: Document_Pydantic
+    product_id: int
+    score: float
+    snippet: str
+
+@document_router.get("/search", response_model=List[DocumentSearchResult])
+async def search_document_contents(
+    q: str = Query(..., min_length=1, description="Words to find in document labels and contents"),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Full-text search inside uploaded PDFs, spreadsheets and text files, best matches first.
+    Each result has a snippet with matching words wrapped in `<mark>` tags (HTML-escaped otherwise).
+    Newly uploaded documents become searchable once the background extraction has processed them.
+    """
+    return await search_documents(q, limit, offset)
+
 @document_router.get("/{document_id}", response_model=Document_Pydantic)
 async def get_document(document_id: int):
     try:
@@ -283,6 +489,43 @@ async def get_document(document_id: int):
         raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
     return await Document_Pydantic.from_tortoise_orm(document)
 
+# Media types safe to render inline from the API origin. Anything else (HTML, SVG, XML, ...)
+# could run script there, so it is downloaded as an opaque attachment instead.
+INLINE_CONTENT_TYPES = {"application/pdf", "image/png", "image/jpeg", "image/gif", "image/webp", "image/bmp"}
+
+def document_file_response(path: str, content_type: Optional[str], headers: Optional[dict] = None) -> FileResponse:
+    media_type = (content_type or mimetypes.guess_type(path)[0] or "").split(";")[0].strip().lower()
+    headers = {**(headers or {}), "X-Content-Type-Options": "nosniff"}
+    if media_type in INLINE_CONTENT_TYPES:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    return FileResponse(
+        path, media_type="application/octet-stream", headers=headers,
+        filename=os.path.basename(path), content_disposition_type="attachment",
+    )
+
+@document_router.get("/{document_id}/content", summary="Download a Document")
+async def get_document_content(document_id: int):
+    """
+    Serves the document file. URL documents are served from their local mirror copy
+    (the last good one, even while the origin is failing); until the first copy exists
+    the request is redirected to the original URL.
+    Only PDFs and raster images are shown inline; other files are sent as attachments.
+    """
+    try:
+        document = await Document.get(id=document_id)
+    except DoesNotExist:
+        raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+
+    if not is_remote_url(document.path_or_url):
+        if not os.path.exists(document.path_or_url):
+            raise HTTPException(status_code=404, detail=f"File for document {document_id} not found")
+        return document_file_response(document.path_or_url, None)
+
+    mirror = await DocumentMirror.get_or_none(document_id=document_id)
+    if mirror is None or not mirror.local_path or mirror.url != document.path_or_url or not os.path.exists(mirror.local_path):
+        return RedirectResponse(document.path_or_url, status_code=307)
+    return document_file_response(mirror.local_path, mirror.content_type, headers={"X-Mirror-Status": mirror.status})
+
 @document_router.delete("/{document_id}", response_model=dict)
 async def delete_document(document_id: int):
     try:
@@ -302,6 +545,7 @@ async def delete_document(document_id: int):
     if file_path_to_delete and os.path.exists(file_path_to_delete):
         try:
             os.remove(file_path_to_delete)
+            remove_precompressed_variants(file_path_to_delete)
             # Attempt to remove empty parent directories
             parent_dir = os.path.dirname(file_path_to_delete) # e.g. media/product_X/type
             if parent_dir != BASE_MEDIA_DIR and not os.listdir(parent_dir):
@@ -314,6 +558,8 @@ async def delete_document(document_id: int):
             print(f"Warning: Could not delete file {file_path_to_delete} or empty dir: {e}")
             return {"message": f"Document {document_id} deleted from DB, but file/dir cleanup failed for {file_path_to_delete}."}
 
+    extraction_service.notify([document_id]) # Drops the document from the search index
+    mirror_service.notify() # Removes the local copy of a URL document
     return {"message": f"Document {document_id} deleted successfully"}
 
 app.include_router(product_router)
@@ -322,13 +568,22 @@ app.include_router(document_router)
 # --- Import Router ---
 import_router = APIRouter(prefix="/import", tags=["Import"])
 
+def parse_sheet_names(sheets: Optional[str]) -> Optional[List[str]]:
+    """Comma-separated sheet names from the query string, or None for all sheets."""
+    names = [name.strip() for name in (sheets or "").split(",") if name.strip()]
+    return names or None
+
 @import_router.post("/products-file/", summary="Import Products from Excel/CSV File")
 async def upload_products_file(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(..., description="Excel (.xlsx) or CSV (.csv) file containing product data.")
+    file: UploadFile = File(..., description="Excel (.xlsx) or CSV (.csv) file containing product data."),
+    priority: str = Query(DEFAULT_PRIORITY, description=f"Scheduling class: {', '.join(PRIORITY_CLASSES)}"),
+    sheets: Optional[str] = Query(None, description="Comma-separated worksheet names to import (default: every sheet)")
 ):
     """
-    Upload a file to import products. The import process runs in the background.
+    Upload a file to import products. The import is queued on the import scheduler
+    and runs in the background; follow it with `GET /jobs/{job_id}`.
+    When the queue is full the request is rejected with 429 and a Retry-After header.
+    Use `priority=nightly` for bulk feeds so they yield to interactive imports.
     The file should have columns like 'Product Name', 'Reference', 'Description'.
     (See `src/backend/import_utils.py` for column name variations).
     - **Name (Mandatory)**: Product's name.
@@ -338,20 +593,113 @@ async def upload_products_file(
     Products are identified by their 'Name'. If a product with the same name
     already exists, its Reference and Description will be updated if new values
     are provided in the file. New products will be created.
+
+    Every worksheet of an Excel file is imported (each with its own header row),
+    or only the ones listed in `sheets`. The job result has counts per sheet.
     """
     if not (file.filename.endswith(".xlsx") or file.filename.endswith(".csv")):
         raise HTTPException(status_code=400, detail="Invalid file type. Only .xlsx or .csv allowed.")
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority. Allowed: {', '.join(PRIORITY_CLASSES)}")
+    import_scheduler.reject_if_full() # Fail fast, before reading the upload
 
     file_content = await file.read()
     await file.close() # Close the file after reading its content
 
-    # Add the import task to background
-    background_tasks.add_task(import_products_from_file_content, file_content, file.filename)
+    job_id = create_job("product_import", filename=file.filename, priority=priority)
+    import_scheduler.submit(job_id, priority, import_products_from_file_content, file_content, file.filename, sheets=parse_sheet_names(sheets))
+
+    return {"job_id": job_id, "message": f"File '{file.filename}' received. Products import is queued; results (created, updated, skipped) are reported by GET /jobs/{job_id}."}
+
+@import_router.post("/products-files/", summary="Import Products from Several Excel/CSV Files")
+async def upload_products_files(
+    files: List[UploadFile] = File(..., description="Excel (.xlsx) and/or CSV (.csv) files containing product data."),
+    priority: str = Query(DEFAULT_PRIORITY, description=f"Scheduling class: {', '.join(PRIORITY_CLASSES)}"),
+    sheets: Optional[str] = Query(None, description="Comma-separated worksheet names to import from each workbook (default: every sheet)")
+):
+    """
+    Same as `POST /import/products-file/` for several files in one job: the worksheets
+    of all workbooks are parsed in parallel and imported in file and sheet order.
+    """
+    for file in files:
+        if not (file.filename.endswith(".xlsx") or file.filename.endswith(".csv")):
+            raise HTTPException(status_code=400, detail=f"Invalid file type for '{file.filename}'. Only .xlsx or .csv allowed.")
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority. Allowed: {', '.join(PRIORITY_CLASSES)}")
+    import_scheduler.reject_if_full() # Fail fast, before reading the uploads
+
+    contents = []
+    for file in files:
+        contents.append((file.filename, await file.read()))
+        await file.close()
 
-    return {"message": f"File '{file.filename}' received. Products import is processing in the background. Results (created, updated, skipped) will be logged by the server."}
+    filenames = [filename for filename, _ in contents]
+    job_id = create_job("product_import", filenames=filenames, priority=priority)
+    import_scheduler.submit(job_id, priority, import_products_from_files, contents, sheets=parse_sheet_names(sheets))
+
+    return {"job_id": job_id, "message": f"{len(filenames)} file(s) received. Products import is queued; results per file and sheet are reported by GET /jobs/{job_id}."}
+
+@import_router.get("/queue", summary="Import Scheduler Status")
+async def get_import_queue():
+    return import_scheduler.stats()
 
 app.include_router(import_router)
 
+# --- Background Jobs Router ---
+job_router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+@job_router.get("/", summary="List Background Jobs")
+async def list_background_jobs(kind: Optional[str] = Query(None, description="Only jobs of this kind, e.g. 'document_archive'")):
+    return list_jobs(kind)
+
+@job_router.get("/{job_id}", summary="Get Background Job Status")
+async def get_background_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+app.include_router(job_router)
+
+# --- System / Operations Router ---
+system_router = APIRouter(prefix="/system", tags=["System"])
+
+@system_router.get("/admission", summary="Upload Admission Control Counters")
+async def get_admission_stats():
+    """
+    In-flight upload bytes and, per guarded route, concurrency, queue depth,
+    admitted and rejected request counters.
+    """
+    return admission_controller.stats()
+
+@system_router.get("/compression", summary="Response Compression Counters")
+async def get_compression_stats():
+    """
+    Negotiated encodings, size threshold, CPU budget and compression counters,
+    plus the background precompressed sidecar queue.
+    """
+    return {**compression_controller.stats(), "sidecars": sidecar_service.stats()}
+
+@system_router.get("/extraction", summary="Document Text Extraction Status")
+async def get_extraction_stats():
+    return extraction_service.stats()
+
+@system_router.get("/mirroring", summary="URL Document Mirroring Status")
+async def get_mirroring_stats():
+    """
+    Mirroring settings and counters, plus the number of URL documents per mirror status.
+    """
+    return {**mirror_service.stats(), "documents": await mirror_service.status_counts()}
+
+@system_router.get("/suggest", summary="Typeahead Index Size and Latency")
+async def get_suggest_stats():
+    """
+    Indexed products and keys, approximate memory footprint and query latency (microseconds).
+    """
+    return suggest_index.stats()
+
+app.include_router(system_router)
+
 @app.get("/")
 async def read_root_message(): # Renamed to avoid conflict with router's root
     return {"message": "Welcome to the Product Data Manager API. See /docs for API documentation."}
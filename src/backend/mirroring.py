@@ -0,0 +1,402 @@
+import asyncio
+import ipaddress
+import mimetypes
+import os
+import re
+import socket
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+from urllib.parse import unquote, urlsplit
+
+import aiofiles # For async file operations
+import httpcore
+import httpx
+from tortoise import connections, timezone
+
+from src.backend.background import BackgroundService
+from src.backend.compression import remove_precompressed_variants
+from src.backend.models import Document, DocumentMirror
+from src.backend.search import extraction_service
+
+# Background mirroring of URL documents (added with POST /documents/url/product/{id}).
+# Each URL is downloaded once through a shared, connection-pooled HTTP client, stored
+# under MIRROR_DIR and revalidated on a schedule with conditional requests, so documents
+# are served locally even when the supplier's server is slow or down. MIRROR_DIR is NOT
+# the publicly mounted media folder: supplier content (HTML, SVG, ...) must only ever go
+# out through GET /documents/{id}/content, as an attachment with nosniff.
+# Mirror state lives in DocumentMirror rows, so after a restart the service simply resumes.
+MIRROR_MAX_CONNECTIONS = int(os.environ.get("PDM_MIRROR_MAX_CONNECTIONS", "20"))
+MIRROR_PER_HOST_CONCURRENCY = int(os.environ.get("PDM_MIRROR_PER_HOST_CONCURRENCY", "2"))
+MIRROR_TIMEOUT_SECONDS = float(os.environ.get("PDM_MIRROR_TIMEOUT", "30"))
+MIRROR_MAX_BYTES = int(os.environ.get("PDM_MIRROR_MAX_BYTES", str(100 * 1024 * 1024)))
+MIRROR_REVALIDATE_SECONDS = float(os.environ.get("PDM_MIRROR_REVALIDATE_INTERVAL", str(24 * 3600)))
+MIRROR_RETRY_SECONDS = float(os.environ.get("PDM_MIRROR_RETRY_INTERVAL", "300")) # Doubles per consecutive failure
+MIRROR_SCAN_INTERVAL_SECONDS = float(os.environ.get("PDM_MIRROR_SCAN_INTERVAL", "60"))
+MIRROR_MAX_REDIRECTS = 5
+# Only public addresses are fetched: the host of every connection is resolved once, loopback,
+# private, link-local (cloud metadata) and other non-global addresses are refused, and the
+# socket goes to exactly the addresses that were checked (no DNS rebinding in between).
+# Hosts listed here (comma-separated) are exempt, e.g. a supplier portal on the internal network.
+MIRROR_ALLOWED_HOSTS = {h.strip().lower() for h in os.environ.get("PDM_MIRROR_ALLOWED_HOSTS", "").split(",") if h.strip()}
+MIRROR_BATCH_SIZE = 50 # Due mirrors fetched concurrently per round (per-host limits still apply)
+MIRROR_DIR = os.environ.get("PDM_MIRROR_DIR", "mirror") # Copies go to <MIRROR_DIR>/product_<id>/
+# Copies used to be stored in media/product_<id>/<type>/mirrored/, where /media served them
+# inline; such legacy copies are deleted and fetched again into MIRROR_DIR
+LEGACY_MIRROR_DIRNAME = "mirrored"
+SCAN_PAGE_SIZE = 500
+
+STATUS_PENDING = "pending"
+STATUS_MIRRORED = "mirrored"
+STATUS_FAILED = "failed"
+
+USER_AGENT = "ProductDataManager-Mirror/1.0"
+
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def is_remote_url(path_or_url: str) -> bool:
+    return path_or_url.startswith(("http://", "https://"))
+
+
+def mirror_filename(document_id: int, url: str, content_type: Optional[str]) -> str:
+    """'<document id>_<sanitized last URL path segment>', with an extension guessed from the content type if missing."""
+    name = unquote(os.path.basename(urlsplit(url).path))
+    name = _UNSAFE_FILENAME_CHARS.sub("_", name).strip("._")[:100] or "document"
+    if not os.path.splitext(name)[1] and content_type:
+        name += mimetypes.guess_extension(content_type.split(";")[0].strip()) or ""
+    return f"{document_id}_{name}"
+
+
+class MirrorError(Exception):
+    pass
+
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0]) # Drop an IPv6 zone id
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def _resolve(host: str, port: int) -> List[str]:
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise MirrorError(f"Cannot resolve {host}: {e}")
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+class _PinnedNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    Resolves the host of each new connection once, refuses non-public addresses unless the
+    host is allowed, then connects to exactly the addresses it checked. TLS still uses the
+    URL's host name for SNI and certificate checks.
+    """
+
+    def __init__(self, allowed_hosts: Callable[[], Set[str]]):
+        self._allowed_hosts = allowed_hosts
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host: str, port: int, timeout=None, local_address=None, socket_options=None):
+        addresses = await _resolve(host, port)
+        if host.lower() not in self._allowed_hosts():
+            for address in addresses:
+                if not _is_public_address(address):
+                    raise MirrorError(f"Refusing to fetch from non-public address {address} ({host})")
+        error = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path: str, timeout=None, socket_options=None):
+        raise MirrorError("Unix sockets are not supported")
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+def _remove_local_copy(path: Optional[str]) -> None:
+    if path and os.path.exists(path):
+        os.remove(path)
+        remove_precompressed_variants(path) # Legacy copies in the media folder had sidecars
+
+
+class MirrorService(BackgroundService):
+    """
+    Keeps a local copy of every URL document. A pass registers new URL documents, drops
+    copies of deleted ones and (re)fetches mirrors whose next_check_at is due, with at most
+    MIRROR_PER_HOST_CONCURRENCY requests per origin host. Successful fetches are revalidated
+    every MIRROR_REVALIDATE_SECONDS; failures are retried with exponential backoff while
+    any previous copy keeps being served. Passes run at startup, when notified and
+    every MIRROR_SCAN_INTERVAL_SECONDS. Nothing here runs on the request path.
+    """
+
+    description = "document mirroring"
+
+    def __init__(
+        self,
+        mirror_dir: str = MIRROR_DIR,
+        per_host_concurrency: int = MIRROR_PER_HOST_CONCURRENCY,
+        scan_interval: float = MIRROR_SCAN_INTERVAL_SECONDS,
+        allowed_hosts=MIRROR_ALLOWED_HOSTS,
+    ):
+        super().__init__(scan_interval)
+        self.mirror_dir = mirror_dir
+        self.allowed_hosts = set(allowed_hosts) # Exempt from the public address check
+        self.per_host_concurrency = max(1, per_host_concurrency)
+        self.counters = {"passes": 0, "fetched": 0, "not_modified": 0, "failed": 0, "removed": 0, "bytes_fetched": 0}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._legacy_checked = False # Legacy copies predate the upgrade: checking once per process is enough
+
+    def _reset_loop_state(self) -> None:
+        self._host_limits = {}
+        self._client = None # Pooled connections belong to the loop that opened them
+
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            limits = httpx.Limits(max_connections=MIRROR_MAX_CONNECTIONS, max_keepalive_connections=MIRROR_MAX_CONNECTIONS)
+            transport = httpx.AsyncHTTPTransport(limits=limits)
+            # httpx does not expose httpcore's network_backend: rebuild its pool around the pinned one
+            transport._pool = httpcore.AsyncConnectionPool(
+                ssl_context=httpx.create_ssl_context(),
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry,
+                network_backend=_PinnedNetworkBackend(lambda: self.allowed_hosts),
+            )
+            self._client = httpx.AsyncClient(
+                transport=transport,
+                trust_env=False, # No environment proxies: the checked address must be the one connected to
+                timeout=httpx.Timeout(MIRROR_TIMEOUT_SECONDS),
+                follow_redirects=False, # Followed in _send, limited to http(s) URLs
+                headers={"User-Agent": USER_AGENT},
+            )
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = (urlsplit(url).hostname or "").lower()
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_limits[host]
+
+    async def _send(self, url: str, headers: Dict[str, str]) -> httpx.Response:
+        """
+        GET `url` as a streamed response, following redirects only to http(s) URLs.
+        Every connection, redirect targets included, is checked by _PinnedNetworkBackend.
+        """
+        client = self._http_client()
+        for _ in range(MIRROR_MAX_REDIRECTS + 1):
+            if not urlsplit(url).hostname:
+                raise MirrorError("URL has no host")
+            response = await client.send(client.build_request("GET", url, headers=headers), stream=True)
+            if response.status_code not in (301, 302, 303, 307, 308) or "location" not in response.headers:
+                return response # Includes 304 Not Modified
+            await response.aclose()
+            url = str(response.url.join(response.headers["location"]))
+            if not is_remote_url(url):
+                raise MirrorError(f"Redirect to unsupported URL {url}")
+        raise MirrorError(f"More than {MIRROR_MAX_REDIRECTS} redirects")
+
+    async def shutdown(self) -> None:
+        await super().shutdown()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def run_once(self) -> Dict[str, int]:
+        """Runs one pass over new, deleted and due mirrors and returns what it did."""
+        self._bind_loop()
+        async with self._lock:
+            summary = {"fetched": 0, "not_modified": 0, "failed": 0, "removed": await self._remove_orphans()}
+            if not self._legacy_checked:
+                await self._drop_legacy_copies()
+                self._legacy_checked = True
+            await self._register_new()
+            fetched_ids = []
+
+            while True:
+                due = await DocumentMirror.filter(next_check_at__lte=timezone.now()).order_by("next_check_at").limit(MIRROR_BATCH_SIZE)
+                if not due:
+                    break
+                outcomes = await asyncio.gather(*(self._refresh(mirror) for mirror in due))
+                for mirror, outcome in zip(due, outcomes):
+                    summary[outcome] += 1 # Every outcome moves next_check_at forward or drops the row
+                    if outcome == "fetched":
+                        fetched_ids.append(mirror.document_id)
+
+            if fetched_ids:
+                extraction_service.notify(fetched_ids) # Mirrored PDFs and workbooks become searchable too
+            self.counters["passes"] += 1
+            for key in ("fetched", "not_modified", "failed", "removed"):
+                self.counters[key] += summary[key]
+            return summary
+
+    async def _drop_legacy_copies(self) -> int:
+        """
+        Deletes copies that earlier versions stored in the public media folder and makes
+        their mirrors due for a full download into mirror_dir. Returns how many were dropped.
+        """
+        mirror_root = os.path.realpath(self.mirror_dir)
+        rows = await DocumentMirror.filter(
+            local_path__contains=f"{os.sep}{LEGACY_MIRROR_DIRNAME}{os.sep}"
+        ).values_list("id", "local_path")
+        legacy = [(mirror_id, path) for mirror_id, path in rows if os.path.commonpath([mirror_root, os.path.realpath(path)]) != mirror_root]
+        for _, path in legacy:
+            try:
+                await asyncio.to_thread(_remove_local_copy, path)
+            except OSError as e:
+                print(f"Warning: Could not delete mirrored file {path}: {e}")
+        if legacy:
+            await DocumentMirror.filter(id__in=[mirror_id for mirror_id, _ in legacy]).update(
+                local_path=None, etag=None, last_modified=None, next_check_at=timezone.now()
+            )
+        return len(legacy)
+
+    async def _register_new(self) -> None:
+        """Creates a due DocumentMirror row for every URL document that has none yet."""
+        mirror_table = DocumentMirror._meta.db_table
+        document_table = Document._meta.db_table
+        while True:
+            rows = await connections.get("default").execute_query_dict(
+                f'SELECT d.id, d.path_or_url FROM "{document_table}" d '
+                f'LEFT JOIN "{mirror_table}" m ON m.document_id = d.id '
+                f"WHERE m.id IS NULL AND (d.path_or_url LIKE 'http://%' OR d.path_or_url LIKE 'https://%') "
+                f"LIMIT {SCAN_PAGE_SIZE}"
+            )
+            if not rows:
+                return
+            now = timezone.now()
+            await DocumentMirror.bulk_create([
+                DocumentMirror(document_id=row["id"], url=row["path_or_url"], next_check_at=now) for row in rows
+            ])
+
+    async def _remove_orphans(self) -> int:
+        """Deletes local copies (and rows) of documents that were deleted or are no longer URLs."""
+        removed = 0
+        mirror_table = DocumentMirror._meta.db_table
+        document_table = Document._meta.db_table
+        while True:
+            rows = await connections.get("default").execute_query_dict(
+                f'SELECT m.id, m.local_path FROM "{mirror_table}" m '
+                f'LEFT JOIN "{document_table}" d ON d.id = m.document_id '
+                f"WHERE d.id IS NULL OR NOT (d.path_or_url LIKE 'http://%' OR d.path_or_url LIKE 'https://%') "
+                f"LIMIT {SCAN_PAGE_SIZE}"
+            )
+            if not rows:
+                return removed
+            for row in rows:
+                try:
+                    await asyncio.to_thread(_remove_local_copy, row["local_path"])
+                except OSError as e:
+                    print(f"Warning: Could not delete mirrored file {row['local_path']}: {e}")
+            await DocumentMirror.filter(id__in=[row["id"] for row in rows]).delete()
+            removed += len(rows)
+
+    async def _refresh(self, mirror: DocumentMirror) -> str:
+        """Fetches or revalidates one mirror. Returns 'fetched', 'not_modified', 'failed' or 'removed'."""
+        document = await Document.get_or_none(id=mirror.document_id)
+        if document is None or not is_remote_url(document.path_or_url): # Deleted since the pass started
+            try:
+                await asyncio.to_thread(_remove_local_copy, mirror.local_path)
+            except OSError as e:
+                print(f"Warning: Could not delete mirrored file {mirror.local_path}: {e}")
+            await DocumentMirror.filter(id=mirror.id).delete()
+            return "removed"
+
+        url = document.path_or_url
+        headers = {}
+        if url == mirror.url and mirror.local_path and os.path.exists(mirror.local_path):
+            if mirror.etag:
+                headers["If-None-Match"] = mirror.etag
+            if mirror.last_modified:
+                headers["If-Modified-Since"] = mirror.last_modified
+
+        now = timezone.now()
+        try:
+            async with self._host_limit(url):
+                response = await self._send(url, headers)
+                try:
+                    if response.status_code == 304:
+                        await DocumentMirror.filter(id=mirror.id).update(
+                            status=STATUS_MIRRORED, error=None, failures=0, checked_at=now,
+                            etag=response.headers.get("etag", mirror.etag),
+                            next_check_at=now + timedelta(seconds=MIRROR_REVALIDATE_SECONDS),
+                        )
+                        return "not_modified"
+                    if response.status_code != 200:
+                        raise MirrorError(f"HTTP {response.status_code} from origin")
+                    local_path, size = await self._store(document, url, response)
+                finally:
+                    await response.aclose()
+        except Exception as e: # Network, HTTP, size and disk errors alike: back off and keep serving the old copy
+            failures = mirror.failures + 1
+            backoff = min(MIRROR_RETRY_SECONDS * 2 ** (failures - 1), MIRROR_REVALIDATE_SECONDS)
+            await DocumentMirror.filter(id=mirror.id).update(
+                status=STATUS_FAILED, error=str(e) or e.__class__.__name__, failures=failures,
+                checked_at=now, next_check_at=now + timedelta(seconds=backoff),
+            )
+            return "failed"
+
+        if mirror.local_path and mirror.local_path != local_path: # URL changed to a different file name
+            try:
+                await asyncio.to_thread(_remove_local_copy, mirror.local_path)
+            except OSError as e:
+                print(f"Warning: Could not delete previous mirrored file {mirror.local_path}: {e}")
+        await DocumentMirror.filter(id=mirror.id).update(
+            url=url, local_path=local_path, size=size, status=STATUS_MIRRORED, error=None, failures=0,
+            content_type=response.headers.get("content-type"),
+            etag=response.headers.get("etag"), last_modified=response.headers.get("last-modified"),
+            fetched_at=now, checked_at=now, next_check_at=now + timedelta(seconds=MIRROR_REVALIDATE_SECONDS),
+        )
+        self.counters["bytes_fetched"] += size
+        return "fetched"
+
+    async def _store(self, document: Document, url: str, response: httpx.Response):
+        """Streams the response body into the product's folder under mirror_dir. Returns (path, size)."""
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > MIRROR_MAX_BYTES:
+            raise MirrorError(f"Document is larger than {MIRROR_MAX_BYTES} bytes")
+
+        # Only integers and a sanitized file name go into the path, never the document type
+        product_dir = os.path.join(self.mirror_dir, f"product_{int(document.product_id)}")
+        os.makedirs(product_dir, exist_ok=True)
+        file_path = os.path.join(product_dir, mirror_filename(document.id, url, response.headers.get("content-type")))
+        part_path = file_path + ".part"
+
+        size = 0
+        try:
+            async with aiofiles.open(part_path, "wb") as out_file:
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > MIRROR_MAX_BYTES:
+                        raise MirrorError(f"Document is larger than {MIRROR_MAX_BYTES} bytes")
+                    await out_file.write(chunk)
+            os.replace(part_path, file_path) # Readers never see a half-written copy
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+        return file_path, size
+
+    async def status_counts(self) -> Dict[str, int]:
+        rows = await connections.get("default").execute_query_dict(
+            f'SELECT status, COUNT(*) AS count FROM "{DocumentMirror._meta.db_table}" GROUP BY status'
+        )
+        return {row["status"]: row["count"] for row in rows}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "per_host_concurrency": self.per_host_concurrency,
+            "max_connections": MIRROR_MAX_CONNECTIONS,
+            "revalidate_interval": MIRROR_REVALIDATE_SECONDS,
+            "scan_interval": self.scan_interval,
+            "running": self.running,
+            **self.counters,
+        }
+
+
+mirror_service = MirrorService()
@@ -1,6 +1,9 @@
 from tortoise import fields, models
 from tortoise.contrib.pydantic import pydantic_model_creator # To create Pydantic models from Tortoise models
 
+# Allowed values for Document.type
+DOCUMENT_TYPES = ["excel", "image", "pdf", "other"]
+
 class Product(models.Model):
     """
     Represents a product.
@@ -33,6 +36,61 @@ class Document(models.Model):
     def __str__(self):
         return f"{self.type}: {self.label or self.path_or_url} for {self.product_id}"
 
+class ProductChange(models.Model):
+    """
+    Append-only log of product writes, read by the GET /products/changes sync feed.
+    The auto-increment id is the sync cursor: unlike updated_at timestamps it never
+    goes backwards and never ties.
+    """
+    id = fields.BigIntField(pk=True)
+    product_id = fields.IntField(index=True) # Plain int, not a FK: tombstones must outlive the product
+    action = fields.CharField(max_length=10) # "upsert" or "delete"
+    changed_at = fields.DatetimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.action} product {self.product_id} (#{self.id})"
+
+class DocumentContent(models.Model):
+    """
+    Text extracted from a document file for full-text search (see search.py).
+    The text is stored zlib-compressed; the searchable index lives in the document_fts table.
+    """
+    id = fields.IntField(pk=True)
+    document_id = fields.IntField(unique=True) # Plain int, not a FK: kept until the index entry is removed
+    fingerprint = fields.CharField(max_length=1100) # path:size:mtime of the file the text came from
+    status = fields.CharField(max_length=10) # "indexed" or "failed"
+    error = fields.TextField(null=True)
+    label = fields.CharField(max_length=255, null=True) # Indexed label, needed to remove the index entry
+    text = fields.BinaryField(null=True) # zlib-compressed UTF-8
+    text_length = fields.IntField(default=0)
+    extracted_at = fields.DatetimeField(auto_now=True)
+
+    def __str__(self):
+        return f"content of document {self.document_id} ({self.status})"
+
+class DocumentMirror(models.Model):
+    """
+    Local copy of an external URL document (see mirroring.py), stored under MIRROR_DIR
+    (outside the public media folder) and revalidated on a schedule with the origin's ETag / Last-Modified validators.
+    """
+    id = fields.IntField(pk=True)
+    document_id = fields.IntField(unique=True) # Plain int, not a FK: kept until the local copy is removed
+    url = fields.CharField(max_length=1024) # URL the local copy was fetched from
+    local_path = fields.CharField(max_length=1024, null=True) # e.g. "mirror/product_1/7_sheet.pdf"
+    content_type = fields.CharField(max_length=255, null=True)
+    size = fields.BigIntField(default=0)
+    etag = fields.CharField(max_length=255, null=True)
+    last_modified = fields.CharField(max_length=64, null=True)
+    status = fields.CharField(max_length=10, default="pending") # "pending", "mirrored" or "failed"
+    error = fields.TextField(null=True)
+    failures = fields.IntField(default=0) # Consecutive failed fetches, drives the retry backoff
+    fetched_at = fields.DatetimeField(null=True) # Last time the content was (re)downloaded
+    checked_at = fields.DatetimeField(null=True) # Last time the origin was contacted
+    next_check_at = fields.DatetimeField(index=True)
+
+    def __str__(self):
+        return f"mirror of document {self.document_id} ({self.status})"
+
 # Pydantic models for request/response validation (optional but good practice)
 # These can be moved to a separate schemas.py or pydantic_models.py file later
 Product_Pydantic = pydantic_model_creator(Product, name="Product")
@@ -0,0 +1,338 @@
+import asyncio
+import html
+import multiprocessing
+import os
+import re
+import weakref
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from tortoise import connections
+from tortoise.transactions import in_transaction
+
+from src.backend.background import BackgroundService
+from src.backend.models import Document, DocumentContent, DocumentMirror, Document_Pydantic
+from src.backend.text_extraction import extract_text, is_extractable
+
+# Full-text search over document contents.
+# A background ExtractionService keeps DocumentContent rows (compressed text) and the
+# document_fts SQLite FTS5 index in sync with the files on disk. Its state lives in the
+# database, so after a restart it simply resumes with whatever is still missing or stale.
+EXTRACTION_WORKERS = int(os.environ.get("PDM_EXTRACTION_WORKERS", "2"))
+EXTRACTION_SCAN_INTERVAL_SECONDS = float(os.environ.get("PDM_EXTRACTION_SCAN_INTERVAL", "300"))
+EXTRACTION_BATCH_SIZE = 20 # Documents extracted concurrently, then committed in one transaction
+SCAN_PAGE_SIZE = 500
+
+SNIPPET_CHARS = 200
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Contentless FTS5 table (the text itself is only stored once, compressed, in DocumentContent).
+# rowid is the document id. Label matches weigh more than body matches in the ranking.
+FTS_TABLE = "document_fts"
+FTS_SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(label, body, content='', tokenize='unicode61 remove_diacritics 2')"
+)
+FTS_LABEL_WEIGHT = 3.0
+
+STATUS_INDEXED = "indexed"
+STATUS_FAILED = "failed"
+
+_schema_ready = weakref.WeakSet() # Connections on which the FTS table is known to exist
+
+
+async def ensure_search_schema() -> None:
+    conn = connections.get("default")
+    if conn not in _schema_ready:
+        await conn.execute_script(FTS_SCHEMA)
+        _schema_ready.add(conn)
+
+
+def _compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _decompress_text(data: Optional[bytes]) -> str:
+    return zlib.decompress(data).decode("utf-8") if data else ""
+
+
+def _fingerprint(path: str) -> Optional[str]:
+    """path:size:mtime of a local file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _is_local_extractable(document_path: str) -> bool:
+    return not document_path.startswith(("http://", "https://")) and is_extractable(document_path)
+
+
+class ExtractionService(BackgroundService):
+    """
+    Background worker pool extracting text from uploaded PDFs, workbooks and text files.
+    Each pass only handles documents that are new or whose file changed (by fingerprint),
+    and removes index entries of deleted documents. Full passes over every document run
+    at startup and every EXTRACTION_SCAN_INTERVAL_SECONDS; notify(document_ids) after an
+    upload or delete runs a pass over just those documents. Extraction never runs on
+    the request path.
+    """
+
+    description = "document text extraction"
+
+    def __init__(self, workers: int = EXTRACTION_WORKERS, scan_interval: float = EXTRACTION_SCAN_INTERVAL_SECONDS):
+        super().__init__(scan_interval)
+        self.workers = max(1, workers)
+        self.counters = {"passes": 0, "indexed": 0, "failed": 0, "removed": 0}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._full_pass = False # Set by notify() without ids
+        self._dirty_ids: Set[int] = set() # Documents to (re)check in the next targeted pass
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: workers must not inherit the event loop or open database connections
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def notify(self, document_ids: Optional[Iterable[int]] = None) -> bool:
+        """Asks for a pass over the given (new, changed or deleted) documents, or over all when no ids are given."""
+        if not super().notify():
+            return False
+        if document_ids is None:
+            self._full_pass = True
+        else:
+            self._dirty_ids.update(document_ids)
+        return True
+
+    async def shutdown(self) -> None:
+        await super().shutdown()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run_pass(self, periodic: bool) -> None:
+        # Periodic passes catch changes nobody notified about
+        document_ids = None if periodic or self._full_pass else self._dirty_ids
+        self._full_pass, self._dirty_ids = False, set()
+        if document_ids is None or document_ids:
+            await self.run_once(document_ids)
+
+    async def run_once(self, document_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """
+        Runs one incremental pass, over every document or only over `document_ids`,
+        and returns what it did.
+        """
+        self._bind_loop()
+        if document_ids is not None:
+            document_ids = sorted(set(document_ids))
+        async with self._lock:
+            await ensure_search_schema()
+            summary = {"indexed": 0, "failed": 0, "removed": await self._remove_orphans(document_ids)}
+
+            pending = await self._find_pending(document_ids)
+            for start in range(0, len(pending), EXTRACTION_BATCH_SIZE):
+                batch = pending[start:start + EXTRACTION_BATCH_SIZE]
+                results = await asyncio.gather(*(self._extract(item["path"]) for item in batch))
+                async with in_transaction() as conn: # One commit per batch, not per document
+                    for item, (text, error) in zip(batch, results):
+                        await self._store(conn, item, text, error)
+                for _, error in results:
+                    summary["failed" if error else "indexed"] += 1
+
+            self.counters["passes"] += 1
+            for key in ("indexed", "failed", "removed"):
+                self.counters[key] += summary[key]
+            return summary
+
+    async def _extract(self, path: str) -> Tuple[Optional[str], Optional[str]]:
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(self._executor(), extract_text, path)
+            return text, None
+        except Exception as e:
+            return None, str(e) or e.__class__.__name__
+
+    async def _find_pending(self, document_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Documents with an extractable local file (or mirror copy) that has no up-to-date
+        DocumentContent, among all documents or only `document_ids`.
+        """
+        pending = []
+        last_id = 0
+        offset = 0
+        while True:
+            if document_ids is None:
+                query = Document.filter(id__gt=last_id).order_by("id").limit(SCAN_PAGE_SIZE)
+            else:
+                ids = document_ids[offset:offset + SCAN_PAGE_SIZE]
+                offset += SCAN_PAGE_SIZE
+                if not ids:
+                    return pending
+                query = Document.filter(id__in=ids).order_by("id")
+            page = await query.values("id", "path_or_url", "label")
+            if not page:
+                if document_ids is None:
+                    return pending
+                continue # Every id in this slice was deleted
+            last_id = page[-1]["id"]
+
+            # URL documents are extracted from their local mirror copy, once there is one
+            url_ids = [doc["id"] for doc in page if doc["path_or_url"].startswith(("http://", "https://"))]
+            mirrored = dict(await DocumentMirror.filter(
+                document_id__in=url_ids, local_path__isnull=False
+            ).values_list("document_id", "local_path")) if url_ids else {}
+            for doc in page:
+                doc["path"] = mirrored.get(doc["id"], doc["path_or_url"])
+
+            candidates = [doc for doc in page if _is_local_extractable(doc["path"])]
+            if not candidates:
+                continue
+            fingerprints = await asyncio.to_thread(lambda: [_fingerprint(doc["path"]) for doc in candidates])
+            known = dict(await DocumentContent.filter(
+                document_id__in=[doc["id"] for doc in candidates]
+            ).values_list("document_id", "fingerprint"))
+
+            for doc, fingerprint in zip(candidates, fingerprints):
+                if fingerprint is not None and known.get(doc["id"]) != fingerprint:
+                    pending.append({"id": doc["id"], "path": doc["path"], "label": doc["label"], "fingerprint": fingerprint})
+
+    async def _store(self, conn, item: Dict[str, Any], text: Optional[str], error: Optional[str]) -> None:
+        """Writes one extraction result. Runs inside the caller's batch transaction."""
+        previous = await DocumentContent.get_or_none(document_id=item["id"])
+        if previous is not None and previous.status == STATUS_INDEXED:
+            await _fts_delete(conn, item["id"], previous.label, _decompress_text(previous.text))
+
+        values = {
+            "fingerprint": item["fingerprint"],
+            "status": STATUS_FAILED if error else STATUS_INDEXED,
+            "error": error,
+            "label": item["label"],
+            "text": None if error else _compress_text(text),
+            "text_length": 0 if error else len(text),
+        }
+        if previous is None:
+            await DocumentContent.create(document_id=item["id"], **values)
+        else:
+            await DocumentContent.filter(id=previous.id).update(**values)
+
+        if not error:
+            await conn.execute_query(
+                f"INSERT INTO {FTS_TABLE} (rowid, label, body) VALUES (?, ?, ?)",
+                [item["id"], item["label"] or "", text],
+            )
+
+    async def _remove_orphans(self, document_ids: Optional[List[int]] = None) -> int:
+        """
+        Drops content rows and index entries of documents that no longer exist,
+        among all documents or only `document_ids`.
+        """
+        removed = 0
+        content_table = DocumentContent._meta.db_table
+        document_table = Document._meta.db_table
+        offset = 0
+        while True:
+            sql = (
+                f'SELECT c.id, c.document_id, c.status, c.label, c.text FROM "{content_table}" c '
+                f'LEFT JOIN "{document_table}" d ON d.id = c.document_id WHERE d.id IS NULL'
+            )
+            values: List[Any] = []
+            if document_ids is not None:
+                values = document_ids[offset:offset + SCAN_PAGE_SIZE]
+                offset += SCAN_PAGE_SIZE
+                if not values:
+                    return removed
+                sql += f" AND c.document_id IN ({', '.join('?' * len(values))})"
+            rows = await connections.get("default").execute_query_dict(f"{sql} LIMIT {SCAN_PAGE_SIZE}", values)
+            if not rows:
+                if document_ids is None:
+                    return removed
+                continue
+            async with in_transaction() as conn:
+                for row in rows:
+                    if row["status"] == STATUS_INDEXED:
+                        await _fts_delete(conn, row["document_id"], row["label"], _decompress_text(row["text"]))
+                await DocumentContent.filter(id__in=[row["id"] for row in rows]).delete()
+            removed += len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "scan_interval": self.scan_interval, "running": self.running, **self.counters}
+
+
+async def _fts_delete(conn, document_id: int, label: Optional[str], text: str) -> None:
+    # Contentless FTS5 tables need the originally indexed values to remove an entry
+    await conn.execute_query(
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, label, body) VALUES ('delete', ?, ?, ?)",
+        [document_id, label or "", text],
+    )
+
+
+def _search_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def make_snippet(text: str, terms: List[str], size: int = SNIPPET_CHARS) -> str:
+    """
+    Returns an HTML-escaped excerpt of `text` around the first matching term,
+    with every term match wrapped in <mark></mark>.
+    """
+    if not text:
+        return ""
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\w*", re.IGNORECASE) if terms else None
+    first = pattern.search(text) if pattern else None
+
+    start = max(0, first.start() - size // 3) if first else 0
+    end = min(len(text), start + size)
+    excerpt = text[start:end]
+
+    parts, position = [], 0
+    for match in (pattern.finditer(excerpt) if pattern else []):
+        parts.append(html.escape(excerpt[position:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        position = match.end()
+    parts.append(html.escape(excerpt[position:]))
+
+    snippet = "".join(parts).replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+async def search_documents(query: str, limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    Ranked (BM25) full-text search over document labels and extracted contents.
+    Every term must match; the last one also matches as a prefix.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    fts_query = " ".join(f'"{t}"' for t in terms[:-1]) + f' "{terms[-1]}"*'
+
+    await ensure_search_schema()
+    rows = await connections.get("default").execute_query_dict(
+        f"SELECT rowid AS document_id, bm25({FTS_TABLE}, {FTS_LABEL_WEIGHT}, 1.0) AS score "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY score LIMIT ? OFFSET ?",
+        [fts_query.strip(), limit, offset],
+    )
+    ids = [row["document_id"] for row in rows]
+    if not ids:
+        return []
+
+    documents = {doc.id: doc for doc in await Document.filter(id__in=ids)}
+    contents = {c.document_id: c for c in await DocumentContent.filter(document_id__in=ids)}
+
+    results = []
+    for row in rows:
+        document = documents.get(row["document_id"])
+        if document is None: # Deleted; its index entry goes away on the next extraction pass
+            continue
+        content = contents.get(document.id)
+        results.append({
+            "document": Document_Pydantic.model_validate(document),
+            "product_id": document.product_id,
+            "score": -row["score"], # bm25() is lower-is-better
+            "snippet": make_snippet(_decompress_text(content.text) if content else "", terms),
+        })
+    return results
+
+
+extraction_service = ExtractionService()
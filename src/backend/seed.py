@@ -94,5 +94,3 @@ if __name__ == "__main__":
     print("Running seed script...")
     # run_async(seed_data()) # Use this if you prefer Tortoise's runner
     asyncio.run(seed_data())
-
-EOF
@@ -0,0 +1,262 @@
+import asyncio
+import bisect
+import os
+import re
+import sys
+import time
+import unicodedata
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.backend.models import Product
+
+# In-memory prefix index for product typeahead (GET /products/suggest).
+# Keys are normalized product names, references and name word suffixes, kept in a
+# sorted list searched with bisect; a parallel array holds the packed product id
+# and match kind of each key. Write paths keep it current with upsert()/remove().
+MAX_INDEX_ENTRIES = int(os.environ.get("PDM_SUGGEST_MAX_ENTRIES", "1000000"))
+MAX_KEY_LENGTH = 64 # Prefix search only ever needs the start of a key
+MAX_NAME_LENGTH = 120 # Display names kept for responses are truncated to this
+MAX_WORD_KEYS = 6 # Word suffixes indexed per name ("steel hinge", "hinge", ...)
+MAX_SCAN = 256 # Matching keys examined per query; bounds the worst-case latency
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+# Match kinds (lower ranks first)
+KIND_START = 0 # Query is a prefix of the whole name or of the reference
+KIND_WORD = 1 # Query is a prefix of a later word of the name
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Case-folds, strips accents and collapses whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SPACES.sub(" ", stripped.casefold()).strip()
+
+
+def _product_keys(name: Optional[str], ref: Optional[str]) -> List[Tuple[str, int]]:
+    keys = []
+    if name:
+        normalized = normalize(name)
+        keys.append((normalized[:MAX_KEY_LENGTH], KIND_START))
+        words = normalized.split(" ")
+        for i in range(1, min(len(words), MAX_WORD_KEYS + 1)):
+            keys.append((" ".join(words[i:])[:MAX_KEY_LENGTH], KIND_WORD))
+    if ref:
+        keys.append((normalize(ref)[:MAX_KEY_LENGTH], KIND_START))
+    return [k for k in dict.fromkeys(keys) if k[0]]
+
+
+class SuggestIndex:
+    def __init__(self, max_entries: int = MAX_INDEX_ENTRIES):
+        self.max_entries = max_entries
+        self._keys: List[str] = []
+        self._packed = array("q") # (product_id << 1) | kind, parallel to _keys
+        self._products: Dict[int, Tuple[str, Optional[str], List[Tuple[str, int]]]] = {} # id -> (name, ref, keys)
+        self._key_bytes = 0
+        self._skipped_keys = 0
+        self.loaded = False
+        self._loading = False
+        self._pending: List[Tuple[str, tuple]] = [] # Updates received while a load is in flight
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.counters = {"queries": 0, "total_query_us": 0, "max_query_us": 0}
+
+    # --- loading ---
+
+    async def load(self) -> None:
+        """(Re)builds the index from the database. Updates arriving meanwhile are replayed after."""
+        self._loading = True
+        self._pending = []
+        try:
+            rows = await Product.all().values_list("id", "name", "ref")
+            entries, products, key_bytes = [], {}, 0
+            self._skipped_keys = 0
+            for product_id, name, ref in rows:
+                keys = self._fit(_product_keys(name, ref), len(entries))
+                products[product_id] = ((name or "")[:MAX_NAME_LENGTH], ref, keys)
+                for key, kind in keys:
+                    entries.append((key, (product_id << 1) | kind))
+                    key_bytes += sys.getsizeof(key)
+            entries.sort()
+            self._keys = [key for key, _ in entries]
+            self._packed = array("q", (packed for _, packed in entries))
+            self._products = products
+            self._key_bytes = key_bytes
+            self.loaded = True
+        finally:
+            self._loading = False
+        for action, args in self._pending:
+            getattr(self, action)(*args)
+        self._pending = []
+
+    async def ensure_loaded(self) -> None:
+        if self.loaded:
+            return
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop: # Created lazily on the serving loop
+            self._loop = loop
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if not self.loaded:
+                await self.load()
+
+    # --- incremental updates ---
+
+    def _fit(self, keys: List[Tuple[str, int]], used: int) -> List[Tuple[str, int]]:
+        """Trims a product's keys to the room left under max_entries, dropping word keys first."""
+        room = self.max_entries - used
+        if len(keys) <= room:
+            return keys
+        kept = [k for k in keys if k[1] == KIND_START][:max(room, 0)]
+        self._skipped_keys += len(keys) - len(kept)
+        return kept
+
+    def _position(self, key: str, packed: int) -> int:
+        i = bisect.bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i] == key:
+            if self._packed[i] == packed:
+                return i
+            i += 1
+        return -1
+
+    def upsert(self, product_id: int, name: Optional[str], ref: Optional[str]) -> None:
+        """Adds or refreshes a product. Call after it was created or updated."""
+        if self._loading:
+            self._pending.append(("upsert", (product_id, name, ref)))
+            return
+        if not self.loaded:
+            return # The first load reads it from the database
+        self.remove(product_id)
+        keys = self._fit(_product_keys(name, ref), len(self._keys))
+        self._products[product_id] = ((name or "")[:MAX_NAME_LENGTH], ref, keys)
+        for key, kind in keys:
+            i = bisect.bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self._packed.insert(i, (product_id << 1) | kind)
+            self._key_bytes += sys.getsizeof(key)
+
+    def upsert_many(self, products: List[Tuple[int, Optional[str], Optional[str]]]) -> None:
+        """
+        Batch form of upsert() for imports: (id, name, ref) tuples are merged into the
+        sorted arrays in one pass instead of one list insert (memmove) per key.
+        """
+        if self._loading:
+            self._pending.append(("upsert_many", (products,)))
+            return
+        if not self.loaded or not products:
+            return
+        products = list({product[0]: product for product in products}.values()) # Last write per id wins
+
+        stale = []
+        for product_id, _, _ in products:
+            entry = self._products.pop(product_id, None)
+            if entry is not None:
+                stale.extend((key, (product_id << 1) | kind) for key, kind in entry[2])
+        if stale:
+            drop = sorted(i for i in (self._position(key, packed) for key, packed in stale) if i >= 0)
+            keys, packed, prev = [], array("q"), 0
+            for i in drop:
+                keys.extend(self._keys[prev:i])
+                packed.extend(self._packed[prev:i])
+                self._key_bytes -= sys.getsizeof(self._keys[i])
+                prev = i + 1
+            keys.extend(self._keys[prev:])
+            packed.extend(self._packed[prev:])
+            self._keys, self._packed = keys, packed
+
+        added = []
+        for product_id, name, ref in products:
+            product_keys = self._fit(_product_keys(name, ref), len(self._keys) + len(added))
+            self._products[product_id] = ((name or "")[:MAX_NAME_LENGTH], ref, product_keys)
+            added.extend((key, (product_id << 1) | kind) for key, kind in product_keys)
+        if not added:
+            return
+        added.sort()
+        keys, packed, prev = [], array("q"), 0
+        for key, packed_id in added:
+            i = bisect.bisect_right(self._keys, key, prev)
+            keys.extend(self._keys[prev:i])
+            packed.extend(self._packed[prev:i])
+            keys.append(key)
+            packed.append(packed_id)
+            self._key_bytes += sys.getsizeof(key)
+            prev = i
+        keys.extend(self._keys[prev:])
+        packed.extend(self._packed[prev:])
+        self._keys, self._packed = keys, packed
+
+    def remove(self, product_id: int) -> None:
+        """Drops a product. Call after it was deleted."""
+        if self._loading:
+            self._pending.append(("remove", (product_id,)))
+            return
+        entry = self._products.pop(product_id, None)
+        if entry is None:
+            return
+        for key, kind in entry[2]:
+            i = self._position(key, (product_id << 1) | kind)
+            if i >= 0:
+                del self._keys[i]
+                del self._packed[i]
+                self._key_bytes -= sys.getsizeof(key)
+
+    # --- queries ---
+
+    def suggest(self, query: str, limit: int = DEFAULT_SUGGEST_LIMIT) -> List[Dict[str, Any]]:
+        """
+        Top `limit` products whose name, reference or a name word starts with `query`.
+        Whole-name/reference matches rank before word matches, then shorter names first.
+        """
+        started = time.perf_counter()
+        prefix = normalize(query)[:MAX_KEY_LENGTH]
+        results: List[Dict[str, Any]] = []
+        if prefix:
+            best: Dict[int, int] = {}
+            i = bisect.bisect_left(self._keys, prefix)
+            end = min(len(self._keys), i + MAX_SCAN)
+            while i < end and self._keys[i].startswith(prefix):
+                packed = self._packed[i]
+                product_id, kind = packed >> 1, packed & 1
+                if kind < best.get(product_id, 2):
+                    best[product_id] = kind
+                i += 1
+
+            ranked = sorted(best.items(), key=lambda item: (item[1], len(self._products[item[0]][0]), item[0]))
+            for product_id, _ in ranked[:limit]:
+                name, ref, _ = self._products[product_id]
+                results.append({"id": product_id, "name": name, "ref": ref})
+
+        elapsed_us = int((time.perf_counter() - started) * 1_000_000)
+        self.counters["queries"] += 1
+        self.counters["total_query_us"] += elapsed_us
+        self.counters["max_query_us"] = max(self.counters["max_query_us"], elapsed_us)
+        return results
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint: key list and strings, packed id array and product table."""
+        products_bytes = sys.getsizeof(self._products) + sum(
+            sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[2])
+            for entry in self._products.values()
+        )
+        packed_bytes = self._packed.buffer_info()[1] * self._packed.itemsize
+        return sys.getsizeof(self._keys) + self._key_bytes + packed_bytes + products_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        queries = self.counters["queries"]
+        return {
+            "loaded": self.loaded,
+            "products": len(self._products),
+            "entries": len(self._keys),
+            "max_entries": self.max_entries,
+            "skipped_keys": self._skipped_keys,
+            "memory_bytes": self.memory_bytes(),
+            "queries": queries,
+            "avg_query_us": self.counters["total_query_us"] // queries if queries else 0,
+            "max_query_us": self.counters["max_query_us"],
+        }
+
+
+suggest_index = SuggestIndex()
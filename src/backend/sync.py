@@ -0,0 +1,68 @@
+from typing import Any, Dict, Iterable
+
+from src.backend.models import Product, ProductChange, Product_Pydantic
+
+CHANGE_UPSERT = "upsert"
+CHANGE_DELETE = "delete"
+
+# Default / maximum number of change log rows consumed per GET /products/changes page
+DEFAULT_CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+BACKFILL_PAGE_SIZE = 5000
+
+
+async def record_product_changes(product_ids: Iterable[int], action: str) -> None:
+    """
+    Appends one change log row per product id. Every product write path
+    (API endpoints, file imports, bulk deletes) must call this so sync clients see it.
+    """
+    changes = [ProductChange(product_id=product_id, action=action) for product_id in product_ids]
+    if changes:
+        await ProductChange.bulk_create(changes)
+
+
+async def backfill_product_changes() -> int:
+    """
+    Seeds one upsert row per existing product when the change log is empty, i.e. on the
+    first start against a database that predates the log, so that a full sync (since=0)
+    returns the whole catalogue. Returns the number of rows written.
+    """
+    if await ProductChange.exists():
+        return 0
+    seeded = 0
+    last_id = 0
+    while True:
+        product_ids = await Product.filter(id__gt=last_id).order_by('id').limit(BACKFILL_PAGE_SIZE).values_list('id', flat=True)
+        if not product_ids:
+            return seeded
+        await record_product_changes(product_ids, CHANGE_UPSERT)
+        seeded += len(product_ids)
+        last_id = product_ids[-1]
+
+
+async def fetch_product_changes(since: int, limit: int = DEFAULT_CHANGES_LIMIT) -> Dict[str, Any]:
+    """
+    Returns products created/updated and ids deleted after cursor `since`.
+    Several changes to the same product within the page collapse into its latest state.
+    Clients store `next_cursor` and pass it back as `since`; `has_more` means another page is waiting.
+    """
+    rows = await ProductChange.filter(id__gt=since).order_by('id').limit(limit + 1).values_list('id', 'product_id', 'action')
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest_action: Dict[int, str] = {}
+    for _, product_id, action in rows: # Later rows overwrite earlier ones
+        latest_action[product_id] = action
+
+    upserted_ids = [pid for pid, action in latest_action.items() if action == CHANGE_UPSERT]
+    deleted_ids = [pid for pid, action in latest_action.items() if action == CHANGE_DELETE]
+
+    products = await Product.filter(id__in=upserted_ids).order_by('id') if upserted_ids else []
+    # An upserted product missing here was deleted after this page; its tombstone comes in a later page.
+
+    return {
+        "changed": [Product_Pydantic.model_validate(p) for p in products],
+        "deleted": sorted(deleted_ids),
+        "next_cursor": rows[-1][0] if rows else since,
+        "has_more": has_more,
+    }
@@ -0,0 +1,82 @@
+import os
+import re
+
+import openpyxl # For .xlsx files
+from PyPDF2 import PdfReader
+
+# Plain-text extraction from document files. Runs inside the extraction process pool
+# (see src/backend/search.py), so this module deliberately imports nothing from the
+# web app or the ORM.
+
+# Stop extracting once this many characters were collected; enough for search
+# without letting one huge spreadsheet bloat the index.
+MAX_EXTRACTED_CHARS = 1_000_000
+
+EXTRACTABLE_EXTENSIONS = (".pdf", ".xlsx", ".xlsm", ".csv", ".txt")
+
+_WHITESPACE = re.compile(r"[ \t\r\f\v]+")
+
+
+def is_extractable(path: str) -> bool:
+    return path.lower().endswith(EXTRACTABLE_EXTENSIONS)
+
+
+def _normalize(text: str) -> str:
+    lines = (_WHITESPACE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)[:MAX_EXTRACTED_CHARS]
+
+
+def _extract_pdf(path: str) -> str:
+    reader = PdfReader(path)
+    parts, size = [], 0
+    for page in reader.pages:
+        page_text = page.extract_text() or ""
+        parts.append(page_text)
+        size += len(page_text)
+        if size >= MAX_EXTRACTED_CHARS:
+            break
+    return "\n".join(parts)
+
+
+def _extract_workbook(path: str) -> str:
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    parts, size = [], 0
+    try:
+        for sheet in workbook.worksheets: # Every sheet, not only the active one
+            parts.append(sheet.title)
+            for row in sheet.iter_rows(values_only=True):
+                line = " ".join(str(value) for value in row if value is not None)
+                if line:
+                    parts.append(line)
+                    size += len(line)
+                if size >= MAX_EXTRACTED_CHARS:
+                    return "\n".join(parts)
+    finally:
+        workbook.close()
+    return "\n".join(parts)
+
+
+def _extract_plain_text(path: str) -> str:
+    with open(path, "rb") as f:
+        data = f.read(MAX_EXTRACTED_CHARS * 4)
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def extract_text(path: str) -> str:
+    """
+    Returns the normalized text content of a PDF, Excel workbook, CSV or text file.
+    Raises on unreadable files; the caller records the failure.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        text = _extract_pdf(path)
+    elif ext in (".xlsx", ".xlsm"):
+        text = _extract_workbook(path)
+    elif ext in (".csv", ".txt"):
+        text = _extract_plain_text(path)
+    else:
+        raise ValueError(f"Unsupported file type for text extraction: {ext}")
+    return _normalize(text)
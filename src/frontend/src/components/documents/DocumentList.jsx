@@ -20,10 +20,12 @@ const DocumentList = ({ documents, productId, onRefresh }) => {
     }
   };
 
-  const getFileUrl = (pathOrUrl) => {
+  const getFileUrl = (doc) => {
+    const pathOrUrl = doc.path_or_url;
     if (!pathOrUrl) return ''; // Handle null or undefined path
     if (pathOrUrl.startsWith('http://') || pathOrUrl.startsWith('https://')) {
-      return pathOrUrl;
+      // Served from the backend's local mirror copy (falls back to the original URL)
+      return `${API_BASE_URL}/documents/${doc.id}/content`;
     }
     if (pathOrUrl.startsWith('data:image')) { // Check for data URIs
       return pathOrUrl;
@@ -43,7 +45,7 @@ const DocumentList = ({ documents, productId, onRefresh }) => {
         renderItem={(doc) => (
           <List.Item
             actions={[
-              <Link href={getFileUrl(doc.path_or_url)} target="_blank" rel="noopener noreferrer">
+              <Link href={getFileUrl(doc)} target="_blank" rel="noopener noreferrer">
                 Open
               </Link>,
               <Popconfirm
@@ -60,7 +62,7 @@ const DocumentList = ({ documents, productId, onRefresh }) => {
             <List.Item.Meta
               avatar={
                 doc.type === 'image' && doc.path_or_url ? (
-                  <Image width={60} height={60} src={getFileUrl(doc.path_or_url)} alt={doc.label || 'document'} preview={{src: getFileUrl(doc.path_or_url)}} />
+                  <Image width={60} height={60} src={getFileUrl(doc)} alt={doc.label || 'document'} preview={{src: getFileUrl(doc)}} />
                 ) : <Tag>{doc.type}</Tag> // Fallback for non-images or if URL is missing
               }
               title={<Text>{doc.label || (doc.path_or_url ? doc.path_or_url.split('/').pop() : 'N/A')}</Text>}
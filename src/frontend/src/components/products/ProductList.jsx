@@ -1,7 +1,7 @@
-import React from 'react'; // Removed useState, useEffect
-import { List, Button, Input, Typography, Space } from 'antd';
-// No direct API calls needed here if App.jsx handles them.
-// import { fetchProducts, deleteProduct } from '../../services/api';
+import React, { useRef, useState } from 'react';
+import { AutoComplete, List, Button, Input, Typography, Space } from 'antd';
+// Product list calls stay in App.jsx; only the typeahead talks to the API directly
+import { fetchProductSuggestions } from '../../services/api';
 
 const { Search } = Input;
 // const { Title } = Typography; // Title not used
@@ -21,16 +21,47 @@ const ProductList = ({
   // Removed useEffect and loadProducts function
   // Removed local handleDelete function
 
+  // Keystrokes only hit the cheap /products/suggest endpoint; the full list search
+  // runs when a suggestion is picked or the search is submitted.
+  const [suggestions, setSuggestions] = useState([]);
+  const latestQuery = useRef('');
+
+  const handleType = async (value) => {
+    latestQuery.current = value;
+    if (!value.trim()) {
+      setSuggestions([]);
+      return;
+    }
+    try {
+      const results = await fetchProductSuggestions(value);
+      if (latestQuery.current === value) { // Ignore answers to outdated keystrokes
+        setSuggestions(results.map((p) => ({
+          value: p.name,
+          label: p.ref ? `${p.name} (${p.ref})` : p.name,
+          key: p.id,
+        })));
+      }
+    } catch (error) {
+      setSuggestions([]); // Typeahead is best effort; the explicit search still works
+    }
+  };
+
   return (
     <div>
       <Space style={{ marginBottom: 16, display: 'flex', justifyContent: 'space-between' }}>
-        <Search
-          placeholder="Search products by name or ref"
-          onSearch={onSearch} // Pass search term to App.jsx
-          onChange={(e) => !e.target.value && onSearch(e.target.value)} // Trigger search on clear
+        <AutoComplete
+          options={suggestions}
+          onSearch={handleType}
+          onSelect={(value) => onSearch(value)}
           style={{ width: 300 }}
-          allowClear
-        />
+        >
+          <Search
+            placeholder="Search products by name or ref"
+            onSearch={onSearch} // Pass search term to App.jsx
+            onChange={(e) => !e.target.value && onSearch(e.target.value)} // Trigger search on clear
+            allowClear
+          />
+        </AutoComplete>
         <Button type="primary" onClick={onAddProduct}>Add New Product</Button>
       </Space>
       <List
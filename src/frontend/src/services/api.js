@@ -23,6 +23,23 @@ export const fetchProducts = async (searchTerm) => {
   return response.json();
 };
 
+// Typeahead suggestions ({ id, name, ref }) for what the user typed so far
+export const fetchProductSuggestions = async (query, limit = 10) => {
+  const params = new URLSearchParams({ q: query, limit: String(limit) });
+  const response = await fetch(`${API_BASE_URL}/products/suggest?${params}`);
+  if (!response.ok) {
+    let errorMessage = 'Failed to fetch suggestions';
+    try {
+      const errorData = await response.json();
+      errorMessage = errorData.detail || errorMessage;
+    } catch (e) {
+      // Ignore
+    }
+    throw new Error(errorMessage);
+  }
+  return response.json();
+};
+
 // Create a product
 export const createProduct = async (productData) => {
   const response = await fetch(`${API_BASE_URL}/products/`, {
@@ -1,13 +1,34 @@
+import asyncio
+import io
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openpyxl
 import pytest
 import pytest_asyncio # For async fixtures
+from fastapi import FastAPI, HTTPException, Request
 from httpx import AsyncClient
 from tortoise import Tortoise
 
 # Import the FastAPI app and TORTOISE_ORM config
 # The app needs to be accessible for the AsyncClient
 # Adjust path if your app instance is named differently or located elsewhere
+from src.backend import main
+from src.backend.import_utils import shutdown_parse_pool
 from src.backend.main import app, TORTOISE_ORM
-from src.backend.models import Product # To check data directly if needed
+from src.backend.import_scheduler import ImportScheduler
+from src.backend.admission import AdmissionController, AdmissionControlMiddleware, AdmissionRejected, admission_controller
+from src.backend.compression import CompressionController, CompressionMiddleware, PrecompressedStaticFiles, negotiate_encoding, sidecar_service
+from src.backend.mirroring import MirrorService, _is_public_address, mirror_service
+from src.backend.search import extraction_service, make_snippet
+from src.backend.suggest import SuggestIndex, suggest_index
+from src.backend.sync import backfill_product_changes
+from src.backend.jobs import create_job, get_job
+from src.backend.models import Document, DocumentContent, DocumentMirror, Product, ProductChange # To check data directly if needed
 
 # Use a separate test database configuration
 # This is crucial to avoid polluting the development database.
@@ -48,6 +69,11 @@ async def initialize_test_db(event_loop): # event_loop fixture is injected
         print(f"Test database initialized at {TEST_DATABASE_URL} with schemas generated.")
         yield # This is where the tests will run
     finally:
+        await extraction_service.shutdown() # Stop background workers before the DB goes away
+        await mirror_service.shutdown()
+        await sidecar_service.shutdown()
+        await main.import_scheduler.shutdown()
+        shutdown_parse_pool()
         await Tortoise.close_connections()
         print("Test database connections closed.")
 
@@ -70,6 +96,69 @@ async def client() -> AsyncClient:
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
 
+@pytest.fixture()
+def stub_origin():
+    """
+    Local HTTP server standing in for a supplier's website. Serves `files` (path -> body)
+    with an ETag, answers If-None-Match with 304 and records requests and peak concurrency.
+    """
+    state = {"files": {}, "content_types": {}, "redirects": {}, "requests": [], "active": 0, "peak": 0, "delay": 0.0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+                state["requests"].append((self.path, self.headers.get("If-None-Match")))
+            try:
+                time.sleep(state["delay"])
+                if self.path in state["redirects"]:
+                    self.send_response(302)
+                    self.send_header("Location", state["redirects"][self.path])
+                    self.end_headers()
+                    return
+                body = state["files"].get(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                etag = f'"{hash(body) & 0xffffffff:x}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", state["content_types"].get(self.path, "text/plain"))
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["base_url"] = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+async def wait_for_job(client: AsyncClient, job_id: str, timeout: float = 5.0) -> dict:
+    """Polls GET /jobs/{job_id} until the job has finished."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("completed", "failed") or loop.time() > deadline:
+            return job
+        await asyncio.sleep(0.01)
+
 @pytest.mark.asyncio
 async def test_root_path(client: AsyncClient):
     """Test the root path to ensure the API is responsive."""
@@ -168,6 +257,842 @@ async def test_get_existing_product(client: AsyncClient):
     assert "documents" in data
     assert data["documents"] == [] # No documents created for this product yet
 
+@pytest.mark.asyncio
+async def test_get_products_batch(client: AsyncClient):
+    """
+    Test fetching several products with their documents in one request.
+    """
+    await Product.all().delete()
+    p1 = await Product.create(name="Batch A", ref="BA")
+    p2 = await Product.create(name="Batch B", ref="BB")
+    p3 = await Product.create(name="Batch C", ref="BC")
+    await Document.create(product=p1, type="pdf", path_or_url="https://example.com/a.pdf", label="A1")
+    await Document.create(product=p1, type="image", path_or_url="https://example.com/a.png", label="A2")
+    await Document.create(product=p3, type="pdf", path_or_url="https://example.com/c.pdf", label="C1")
+
+    response = await client.get(f"/products/batch?ids={p3.id},{p1.id},99999,{p2.id},{p1.id}")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [p["id"] for p in data] == [p3.id, p1.id, p2.id] # Request order, unknown and duplicate ids dropped
+    assert [d["label"] for d in data[0]["documents"]] == ["C1"]
+    assert [d["label"] for d in data[1]["documents"]] == ["A1", "A2"]
+    assert data[2]["documents"] == []
+
+    response = await client.post("/products/batch", json={"ids": [p2.id, p1.id]})
+    assert response.status_code == 200
+    assert [p["name"] for p in response.json()] == ["Batch B", "Batch A"]
+
+    response = await client.get("/products/batch?ids=1,abc")
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_product_changes_feed(client: AsyncClient):
+    """
+    Test the delta sync feed: upserts, tombstones, collapsing and cursor paging.
+    """
+    await Product.all().delete()
+    await ProductChange.all().delete()
+
+    page = (await client.get("/products/changes")).json()
+    assert page == {"changed": [], "deleted": [], "next_cursor": 0, "has_more": False}
+
+    a = (await client.post("/products/", json={"name": "Sync A"})).json()
+    b = (await client.post("/products/", json={"name": "Sync B"})).json()
+    await client.put(f"/products/{a['id']}", json={"name": "Sync A v2"})
+
+    page = (await client.get("/products/changes?since=0")).json()
+    assert [p["name"] for p in page["changed"]] == ["Sync A v2", "Sync B"] # A's create + update collapse
+    assert page["deleted"] == []
+    cursor = page["next_cursor"]
+
+    await client.delete(f"/products/{b['id']}")
+    csv_content = b"Product Name,Reference\nSync C,SC-1\n"
+    response = await client.post("/import/products-file/", files={"file": ("sync.csv", csv_content, "text/csv")})
+    assert (await wait_for_job(client, response.json()["job_id"]))["status"] == "completed"
+
+    page = (await client.get(f"/products/changes?since={cursor}")).json()
+    assert [p["name"] for p in page["changed"]] == ["Sync C"]
+    assert page["deleted"] == [b["id"]]
+    assert page["next_cursor"] > cursor
+
+    page = (await client.get(f"/products/changes?since={page['next_cursor']}")).json()
+    assert page["changed"] == [] and page["deleted"] == []
+
+    page = (await client.get("/products/changes?since=0&limit=1")).json()
+    assert page["has_more"] is True
+    assert len(page["changed"]) + len(page["deleted"]) == 1
+
+@pytest.mark.asyncio
+async def test_product_changes_backfill(client: AsyncClient):
+    """
+    Test that products written before the change log existed are seeded into it, once.
+    """
+    await Product.all().delete()
+    await ProductChange.all().delete()
+    await Product.bulk_create([Product(name=f"Legacy {i}") for i in range(3)]) # No log rows, as on an old database
+
+    assert (await client.get("/products/changes?since=0")).json()["changed"] == []
+    assert await backfill_product_changes() == 3
+    page = (await client.get("/products/changes?since=0")).json()
+    assert [p["name"] for p in page["changed"]] == ["Legacy 0", "Legacy 1", "Legacy 2"]
+
+    assert await backfill_product_changes() == 0 # The log is no longer empty
+    assert await ProductChange.all().count() == 3
+
+@pytest.mark.asyncio
+async def test_update_product_bumps_updated_at(client: AsyncClient):
+    await Product.all().delete()
+    product = await Product.create(name="Timestamped")
+    await client.put(f"/products/{product.id}", json={"name": "Timestamped v2"})
+    updated = await Product.get(id=product.id)
+    assert updated.updated_at > product.updated_at
+
+@pytest.mark.asyncio
+async def test_suggest_products(client: AsyncClient):
+    """
+    Test typeahead suggestions and that every product write path keeps the index current.
+    """
+    await Product.all().delete()
+    await Product.create(name="Stainless Steel Hinge", ref="HNG-100")
+    await suggest_index.load() # Rows written directly through the ORM are picked up by a (re)load
+
+    response = await client.get("/products/suggest?q=stee")
+    assert response.status_code == 200
+    assert [s["name"] for s in response.json()] == ["Stainless Steel Hinge"] # Word match
+
+    created = (await client.post("/products/", json={"name": "Steel Bracket", "ref": "BRK-1"})).json()
+    names = [s["name"] for s in (await client.get("/products/suggest?q=STÉEL")).json()]
+    assert names == ["Steel Bracket", "Stainless Steel Hinge"] # Name start ranks before word match
+
+    assert [s["id"] for s in (await client.get("/products/suggest?q=brk")).json()] == [created["id"]]
+
+    await client.put(f"/products/{created['id']}", json={"name": "Angle Bracket"})
+    assert [s["name"] for s in (await client.get("/products/suggest?q=angle")).json()] == ["Angle Bracket"]
+    assert [s["name"] for s in (await client.get("/products/suggest?q=steel")).json()] == ["Stainless Steel Hinge"]
+
+    await client.delete(f"/products/{created['id']}")
+    assert (await client.get("/products/suggest?q=angle")).json() == []
+
+    csv_content = b"Product Name,Reference\nSteel Rail,RL-9\n"
+    response = await client.post("/import/products-file/", files={"file": ("rails.csv", csv_content, "text/csv")})
+    assert (await wait_for_job(client, response.json()["job_id"]))["status"] == "completed"
+    assert [s["ref"] for s in (await client.get("/products/suggest?q=rl-")).json()] == ["RL-9"]
+
+    assert (await client.get("/products/suggest?q=steel&limit=1")).json()[0]["name"] == "Steel Rail"
+    assert (await client.get("/products/suggest?q=")).status_code == 422
+
+    stats = (await client.get("/system/suggest")).json()
+    assert stats["products"] == 2 and stats["memory_bytes"] > 0 and stats["queries"] > 0
+
+def test_suggest_index_entry_bound():
+    index = SuggestIndex(max_entries=3)
+    index.loaded = True
+    index.upsert(1, "Red Oak Table", "T-1") # 4 keys: name, "oak table", "table", ref
+    assert index.stats()["entries"] == 2 # Word keys are dropped first
+    assert index.suggest("table") == [] and [s["id"] for s in index.suggest("t-1")] == [1]
+    index.upsert(2, "Chair", None)
+    index.upsert(3, "Desk", None) # Index is full
+    assert index.stats()["entries"] == 3 and index.stats()["skipped_keys"] == 3
+    assert index.suggest("desk") == []
+    index.remove(1)
+    assert index.stats()["entries"] == 1
+
+@pytest.mark.asyncio
+async def test_import_products_file_job(client: AsyncClient):
+    """
+    Test that a product import runs as a tracked job and reports its summary.
+    """
+    await Product.all().delete()
+    await Product.create(name="Existing Import", ref="OLD")
+    csv_content = b"Product Name,Reference,Description\nExisting Import,NEW,\nFresh Import,FI-1,Brand new\n,NO-NAME,\n"
+
+    response = await client.post(
+        "/import/products-file/?priority=nightly",
+        files={"file": ("products.csv", csv_content, "text/csv")},
+    )
+    assert response.status_code == 200, response.text
+    job = await wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "completed", job
+    assert job["details"]["priority"] == "nightly"
+    assert job["result"] == {
+        "created": 1, "updated": 1, "skipped_due_to_error_or_no_change": 0,
+        "sheets": [{"file": "products.csv", "sheet": None, "created": 1, "updated": 1, "skipped": 0, "error": None}],
+    }
+    assert (await Product.get(name="Existing Import")).ref == "NEW"
+
+    response = await client.post(
+        "/import/products-file/?priority=urgent",
+        files={"file": ("products.csv", csv_content, "text/csv")},
+    )
+    assert response.status_code == 400
+
+def make_workbook(sheets: dict) -> bytes:
+    """Builds an .xlsx file from {sheet title: list of rows}."""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+@pytest.mark.asyncio
+async def test_import_multi_sheet_workbook(client: AsyncClient):
+    """
+    Test that every sheet is imported with its own header, and that sheets can be selected.
+    """
+    await Product.all().delete()
+    content = make_workbook({
+        "Hinges": [["Product Name", "Reference"], ["Hinge A", "H-A"], ["Hinge B", "H-B"]],
+        "Brackets": [["SKU", "Description", "Title"], ["B-1", "Steel", "Bracket 1"]], # Different column order
+        "Notes": [["Comment"], ["not a product sheet"]],
+    })
+    xlsx_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    response = await client.post("/import/products-file/", files={"file": ("families.xlsx", content, xlsx_type)})
+    job = await wait_for_job(client, response.json()["job_id"], timeout=30)
+    assert job["status"] == "completed", job
+    assert job["result"]["created"] == 3
+    sheets = {entry["sheet"]: entry for entry in job["result"]["sheets"]}
+    assert list(sheets) == ["Hinges", "Brackets", "Notes"]
+    assert (sheets["Hinges"]["created"], sheets["Brackets"]["created"]) == (2, 1)
+    assert "Product Name" in sheets["Notes"]["error"]
+    assert (await Product.get(name="Bracket 1")).ref == "B-1"
+
+    response = await client.post("/import/products-file/?sheets=Brackets", files={"file": ("families.xlsx", content, xlsx_type)})
+    job = await wait_for_job(client, response.json()["job_id"], timeout=30)
+    assert [entry["sheet"] for entry in job["result"]["sheets"]] == ["Brackets"]
+
+    response = await client.post("/import/products-file/?sheets=Missing", files={"file": ("families.xlsx", content, xlsx_type)})
+    job = await wait_for_job(client, response.json()["job_id"], timeout=30)
+    assert job["status"] == "failed" and "Missing" in job["error"]
+
+@pytest.mark.asyncio
+async def test_import_several_files(client: AsyncClient):
+    await Product.all().delete()
+    workbook = make_workbook({
+        "Chairs": [["Name", "Ref"], ["Chair", "C-1"]],
+        "Tables": [["Name", "Ref"], ["Table", "T-1"]],
+    })
+    response = await client.post("/import/products-files/", files=[
+        ("files", ("furniture.xlsx", workbook, "application/octet-stream")),
+        ("files", ("extra.csv", b"Product Name,Reference\nChair,C-2\nLamp,L-1\n", "text/csv")),
+    ])
+    assert response.status_code == 200, response.text
+    job = await wait_for_job(client, response.json()["job_id"], timeout=30)
+    assert job["status"] == "completed", job
+    assert job["details"]["filenames"] == ["furniture.xlsx", "extra.csv"]
+    assert [(e["file"], e["sheet"], e["created"], e["updated"]) for e in job["result"]["sheets"]] == [
+        ("furniture.xlsx", "Chairs", 1, 0), ("furniture.xlsx", "Tables", 1, 0), ("extra.csv", None, 1, 1),
+    ]
+    assert (await Product.get(name="Chair")).ref == "C-2" # Files are applied in order
+
+@pytest.mark.asyncio
+async def test_import_scheduler_priority_and_backpressure():
+    """
+    Test that queued jobs run by priority class and that a full queue is rejected with 429.
+    """
+    scheduler = ImportScheduler(workers=1, max_queued=2)
+    release = asyncio.Event()
+    order = []
+
+    async def blocker(chunk_pause):
+        await release.wait()
+
+    async def record(name, chunk_pause):
+        order.append((name, chunk_pause))
+
+    scheduler.submit(create_job("test"), "interactive", blocker)
+    await asyncio.sleep(0) # Let the worker pick up the blocker
+    scheduler.submit(create_job("test"), "nightly", record, "nightly")
+    last_job = create_job("test")
+    scheduler.submit(last_job, "interactive", record, "interactive")
+
+    overflow_job = create_job("test")
+    with pytest.raises(HTTPException) as exc_info:
+        scheduler.submit(overflow_job, "interactive", record, "overflow")
+    assert exc_info.value.status_code == 429
+    assert "Retry-After" in exc_info.value.headers
+    assert get_job(overflow_job) is None # Not left pending forever
+    assert scheduler.stats()["queued"] == 2
+
+    release.set()
+    await scheduler.join()
+    await scheduler.shutdown()
+    assert [name for name, _ in order] == ["interactive", "nightly"]
+    assert dict(order)["nightly"] > dict(order)["interactive"] # Bulk feeds pause longer between chunks
+    assert get_job(last_job)["status"] == "completed"
+
+@pytest.mark.asyncio
+async def test_upload_admission_rejects_when_byte_budget_exceeded(client: AsyncClient, monkeypatch):
+    """
+    Test that uploads over the in-flight byte budget get 503 + Retry-After while reads still work,
+    and uploads larger than the whole budget get 413.
+    """
+    monkeypatch.setattr(admission_controller, "max_inflight_bytes", 10_000)
+    monkeypatch.setattr(admission_controller, "inflight_bytes", 9_990) # Budget mostly held by other uploads
+    before = (await client.get("/system/admission")).json()["routes"]["product_import"]["rejected"]
+    files = {"file": ("big.csv", b"Product Name\n" + b"x\n" * 100, "text/csv")}
+
+    response = await client.post("/import/products-file/", files=files)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+    assert (await client.get("/products/")).status_code == 200 # Read routes are not guarded
+    stats = (await client.get("/system/admission")).json()
+    assert stats["routes"]["product_import"]["rejected"] == before + 1
+    assert stats["inflight_bytes"] == 9_990
+
+    monkeypatch.setattr(admission_controller, "max_inflight_bytes", 10)
+    monkeypatch.setattr(admission_controller, "inflight_bytes", 0)
+    response = await client.post("/import/products-file/", files=files)
+    assert response.status_code == 413 # Could never fit, retrying is pointless
+    assert "Retry-After" not in response.headers
+    assert (await client.get("/system/admission")).json()["inflight_bytes"] == 0
+
+@pytest.mark.asyncio
+async def test_admission_meters_request_bodies():
+    """
+    Test that a body is cut off with 413 once it outgrows its reservation (chunked uploads
+    included), and that a route with its own cap does not draw on the shared byte budget.
+    """
+    inner = FastAPI()
+
+    @inner.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    controller = AdmissionController(
+        routes={"upload": ("POST", r"^/upload$", 2, 100)}, max_inflight_bytes=10, queue_size=1, queue_timeout=0.05
+    )
+    inner.add_middleware(AdmissionControlMiddleware, controller=controller)
+
+    async def chunks(count):
+        for _ in range(count):
+            yield b"x" * 30
+
+    async with AsyncClient(app=inner, base_url="http://test") as test_client:
+        response = await test_client.post("/upload", content=b"x" * 60) # Over the shared budget, under the route cap
+        assert response.status_code == 200 and response.json() == {"size": 60}
+
+        response = await test_client.post("/upload", content=chunks(2)) # Chunked, within the reservation
+        assert response.status_code == 200 and response.json() == {"size": 60}
+
+        response = await test_client.post("/upload", content=chunks(5)) # Chunked, past the reservation
+        assert response.status_code == 413
+
+        response = await test_client.post("/upload", content=b"x" * 101)
+        assert response.status_code == 413
+
+    assert controller.stats()["inflight_bytes"] == 0
+    assert controller.limiters[0].stats()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_chunked_archive_upload_uses_the_route_cap(client: AsyncClient, tmp_path, monkeypatch):
+    """
+    Test that a chunked upload to the archive route may grow up to the route's own cap,
+    not just the fixed share reserved for chunked uploads on the shared budget.
+    """
+    import httpx
+    from src.backend import admission
+
+    monkeypatch.setattr(main, "BASE_MEDIA_DIR", str(tmp_path))
+    monkeypatch.setattr(admission, "UNKNOWN_LENGTH_BYTES", 1024)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("NO-SUCH-REF__blob.bin", os.urandom(8192))
+    request = httpx.Request("POST", "http://test/", files={"archive": ("big.zip", buffer.getvalue(), "application/zip")})
+    body = request.read()
+
+    async def chunks():
+        for start in range(0, len(body), 1000):
+            yield body[start:start + 1000]
+
+    headers = {"Content-Type": request.headers["Content-Type"]} # No Content-Length: chunked
+    response = await client.post("/documents/upload/archive", content=chunks(), headers=headers)
+    assert response.status_code == 200, response.text
+    assert (await wait_for_job(client, response.json()["job_id"]))["status"] == "completed"
+
+    response = await client.post("/import/products-file/", content=chunks(), headers=headers)
+    assert response.status_code == 413 # Shared-budget routes still cut chunked bodies at the fixed share
+
+@pytest.mark.asyncio
+async def test_admission_controller_route_concurrency():
+    """
+    Test per-route slots: one request runs, one may queue, the next is rejected; waiting ones time out.
+    """
+    controller = AdmissionController(
+        routes={"upload": ("POST", r"^/upload$", 1, None)}, max_inflight_bytes=1000, queue_size=1, queue_timeout=0.05
+    )
+    limiter = controller.match("POST", "/upload")
+    assert controller.match("GET", "/upload") is None
+
+    await controller.acquire(limiter, 100)
+    waiter = asyncio.create_task(controller.acquire(limiter, 100))
+    await asyncio.sleep(0)
+    assert limiter.stats()["queue_depth"] == 1
+
+    with pytest.raises(AdmissionRejected):
+        await controller.acquire(limiter, 100) # Queue is full: rejected immediately
+    with pytest.raises(AdmissionRejected):
+        await waiter # Slot never freed within queue_timeout
+
+    controller.release(limiter, 100)
+    await controller.acquire(limiter, 100) # Slot is free again
+    controller.release(limiter, 100)
+    assert controller.stats()["inflight_bytes"] == 0
+    assert limiter.stats()["rejected"] == 2
+    assert limiter.stats()["admitted"] == 2
+
+@pytest.mark.asyncio
+async def test_list_products_response_compression(client: AsyncClient):
+    """
+    Test that large JSON responses are compressed when the client accepts it, and small ones are not.
+    """
+    await Product.all().delete()
+    await Product.bulk_create([Product(name=f"Compressed {i}", description="Long description " * 20) for i in range(20)])
+
+    response = await client.get("/products/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 20 # httpx transparently decodes gzip
+
+    response = await client.get("/products/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+
+    response = await client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers # Below the size threshold
+
+    stats = (await client.get("/system/compression")).json()
+    assert stats["encoding_gzip"] >= 1
+
+@pytest.mark.asyncio
+async def test_compression_skips_partial_and_no_transform_responses(tmp_path):
+    from fastapi.responses import JSONResponse as PlainJSONResponse
+    from starlette.staticfiles import StaticFiles
+
+    (tmp_path / "a.csv").write_bytes(b"".join(b"SKU-%05d,12.50\n" % i for i in range(3000)))
+    inner = FastAPI()
+    inner.mount("/media", StaticFiles(directory=str(tmp_path)))
+
+    @inner.get("/raw")
+    async def raw():
+        return PlainJSONResponse({"data": "x" * 5000}, headers={"Cache-Control": "no-transform"})
+
+    inner.add_middleware(CompressionMiddleware, controller=CompressionController())
+    async with AsyncClient(app=inner, base_url="http://test") as test_client:
+        response = await test_client.get("/media/a.csv", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-4999"})
+        assert response.status_code == 206
+        assert "content-encoding" not in response.headers and len(response.content) == 5000
+
+        response = await test_client.get("/media/a.csv", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["etag"].startswith("W/") # Compressed bytes differ from the identity ETag's
+
+        response = await test_client.get("/raw", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("*") is not None
+    assert negotiate_encoding("br, gzip", available=["gzip"]) == "gzip"
+    assert negotiate_encoding(None) is None
+
+@pytest.mark.asyncio
+async def test_document_upload_writes_precompressed_sidecar(client: AsyncClient, tmp_path, monkeypatch):
+    """
+    Test that a compressible upload gets a gzip sidecar that the media mount serves, and that deletion removes it.
+    """
+    monkeypatch.setattr(main, "BASE_MEDIA_DIR", str(tmp_path))
+    await Product.all().delete()
+    product = await Product.create(name="Sidecar Product")
+    csv_content = b"sku,price\n" + b"".join(b"SKU-%05d,12.50\n" % i for i in range(500))
+
+    response = await client.post(
+        f"/documents/upload/product/{product.id}",
+        files={"file": ("prices.csv", csv_content, "text/csv")},
+        data={"doc_type": "excel"},
+    )
+    assert response.status_code == 200, response.text
+    document = response.json()
+    await sidecar_service.run_once() # Written in the background, after the upload responded
+    sidecar = os.path.join(os.path.dirname(document["path_or_url"]), ".precompressed", "prices.csv.gz")
+    assert os.path.exists(sidecar)
+    assert (await client.get("/system/compression")).json()["sidecars"]["queued"] == 0
+
+    media_app = FastAPI()
+    media_app.mount("/media", PrecompressedStaticFiles(directory=str(tmp_path)))
+    async with AsyncClient(app=media_app, base_url="http://test") as media_client:
+        relative = os.path.relpath(document["path_or_url"], str(tmp_path))
+        response = await media_client.get(f"/media/{relative}", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.content == csv_content
+        assert int(response.headers["content-length"]) < len(csv_content)
+        sidecar_etag = response.headers["etag"]
+        assert sidecar_etag.startswith("W/") and sidecar_etag.endswith('-gzip"')
+
+        response = await media_client.get(f"/media/{relative}", headers={"Accept-Encoding": "gzip", "If-None-Match": sidecar_etag})
+        assert response.status_code == 304 # Revalidating the compressed copy
+        assert response.headers["etag"] == sidecar_etag and response.content == b""
+
+        response = await media_client.get(f"/media/{relative}", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.content == csv_content
+        identity_etag = response.headers["etag"]
+        assert identity_etag != sidecar_etag
+
+        response = await media_client.get(f"/media/{relative}", headers={"Accept-Encoding": "identity", "If-None-Match": identity_etag})
+        assert response.status_code == 304
+        response = await media_client.get(f"/media/{relative}", headers={"Accept-Encoding": "gzip", "If-None-Match": identity_etag})
+        assert response.status_code == 200 and response.headers["content-encoding"] == "gzip" # Other variant
+
+    await client.delete(f"/documents/{document['id']}")
+    assert not os.path.exists(sidecar)
+    assert not os.path.exists(os.path.join(str(tmp_path), f"product_{product.id}")) # Empty dirs cleaned up
+
+@pytest.mark.asyncio
+async def test_document_content_search(client: AsyncClient, tmp_path, monkeypatch):
+    """
+    Test background text extraction from PDF/XLSX uploads, ranked search with snippets,
+    incremental re-extraction and removal of deleted documents from the index.
+    """
+    import openpyxl
+    from PyPDF2 import PdfWriter
+
+    monkeypatch.setattr(main, "BASE_MEDIA_DIR", str(tmp_path))
+    await extraction_service.run_once() # Clear leftovers from earlier tests
+    await Product.all().delete()
+    product = await Product.create(name="Searchable Product")
+
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["Part", "Material"])
+    workbook.active.append(["Hinge", "Stainless steel 316L"])
+    workbook.create_sheet("Second").append(["Gasket", "EPDM rubber"])
+    xlsx_buffer = io.BytesIO()
+    workbook.save(xlsx_buffer)
+
+    pdf_buffer = io.BytesIO()
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200) # No text layer: indexed with empty body
+    writer.write(pdf_buffer)
+
+    xlsx_doc = (await client.post(
+        f"/documents/upload/product/{product.id}",
+        files={"file": ("materials.xlsx", xlsx_buffer.getvalue(), "application/octet-stream")},
+        data={"doc_type": "excel", "label": "Material list"},
+    )).json()
+    pdf_doc = (await client.post(
+        f"/documents/upload/product/{product.id}",
+        files={"file": ("blank.pdf", pdf_buffer.getvalue(), "application/pdf")},
+        data={"doc_type": "pdf", "label": "Stainless datasheet"},
+    )).json()
+
+    await extraction_service.run_once() # Uploads also trigger a background pass; passes never overlap
+    assert await DocumentContent.filter(document_id__in=[xlsx_doc["id"], pdf_doc["id"]], status="indexed").count() == 2
+    assert (await extraction_service.run_once())["indexed"] == 0 # Nothing changed: nothing re-extracted
+
+    results = (await client.get("/documents/search?q=stainless")).json()
+    assert [r["document"]["id"] for r in results] == [pdf_doc["id"], xlsx_doc["id"]] # Label hits rank higher
+    assert "<mark>Stainless</mark> steel 316L" in results[1]["snippet"]
+    assert results[1]["product_id"] == product.id
+
+    results = (await client.get("/documents/search?q=epd")).json() # Prefix match, non-active sheet
+    assert [r["document"]["id"] for r in results] == [xlsx_doc["id"]]
+    assert (await client.get("/documents/search?q=titanium")).json() == []
+
+    content = await DocumentContent.get(document_id=xlsx_doc["id"])
+    assert content.status == "indexed" and content.text_length > 0
+
+    await client.delete(f"/documents/{xlsx_doc['id']}")
+    await extraction_service.run_once([xlsx_doc["id"]]) # Targeted pass, as run by notify(document_ids)
+    assert (await client.get("/documents/search?q=epdm")).json() == []
+    assert not await DocumentContent.exists(document_id=xlsx_doc["id"])
+
+    notes_path = tmp_path / "notes.txt" # Added behind the API's back: only a full pass finds it
+    notes_path.write_text("Torque 12 Nm")
+    notes = await Document.create(product=product, type="other", path_or_url=str(notes_path), label="Notes")
+    assert (await extraction_service.run_once([pdf_doc["id"]]))["indexed"] == 0
+    assert (await extraction_service.run_once())["indexed"] == 1
+    assert [r["document"]["id"] for r in (await client.get("/documents/search?q=torque")).json()] == [notes.id]
+
+def test_make_snippet_highlights_and_escapes():
+    snippet = make_snippet("Intro <b> text. " + "x" * 300 + " The Gasket is EPDM.", ["gasket"], size=40)
+    assert snippet.startswith("…")
+    assert "<mark>Gasket</mark>" in snippet
+    assert "<b>" not in make_snippet("a <b> gasket", ["gasket"])
+
+@pytest.mark.asyncio
+async def test_url_document_mirroring(client: AsyncClient, tmp_path, monkeypatch, stub_origin):
+    """
+    Test that URL documents are mirrored locally, served from the copy and revalidated with ETags.
+    """
+    monkeypatch.setattr(mirror_service, "mirror_dir", str(tmp_path))
+    monkeypatch.setattr(mirror_service, "allowed_hosts", {"127.0.0.1"}) # Test-only: the stub origin is on loopback
+    product = await Product.create(name="Mirrored Product")
+    stub_origin["files"]["/sheets/spec.txt"] = b"Version one"
+    url = stub_origin["base_url"] + "/sheets/spec.txt"
+
+    response = await client.post(f"/documents/url/product/{product.id}", data={"url": url, "doc_type": "other"})
+    document_id = response.json()["id"]
+    await mirror_service.run_once() # Also notified in the background; either pass does the work
+
+    mirror = await DocumentMirror.get(document_id=document_id)
+    assert mirror.status == "mirrored" and mirror.etag
+    assert mirror.local_path == os.path.join(str(tmp_path), f"product_{product.id}", f"{document_id}_spec.txt")
+    response = await client.get(f"/documents/{document_id}/content")
+    assert response.status_code == 200 and response.content == b"Version one"
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["content-disposition"].startswith("attachment")
+    assert response.headers["x-content-type-options"] == "nosniff"
+
+    # Due again: unchanged content is revalidated with a conditional request
+    await DocumentMirror.filter(id=mirror.id).update(next_check_at=mirror.checked_at)
+    summary = await mirror_service.run_once()
+    assert summary["not_modified"] == 1
+    assert stub_origin["requests"][-1] == ("/sheets/spec.txt", mirror.etag)
+
+    # Changed content is downloaded again; a failing origin keeps the last good copy being served
+    stub_origin["files"]["/sheets/spec.txt"] = b"Version two"
+    await DocumentMirror.filter(id=mirror.id).update(next_check_at=mirror.checked_at)
+    assert (await mirror_service.run_once())["fetched"] == 1
+    del stub_origin["files"]["/sheets/spec.txt"]
+    await DocumentMirror.filter(id=mirror.id).update(next_check_at=mirror.checked_at)
+    assert (await mirror_service.run_once())["failed"] == 1
+    mirror = await DocumentMirror.get(document_id=document_id)
+    assert mirror.status == "failed" and mirror.failures == 1 and "404" in mirror.error
+    assert (await client.get(f"/documents/{document_id}/content")).content == b"Version two"
+
+    await client.delete(f"/documents/{document_id}")
+    await mirror_service.run_once()
+    assert not await DocumentMirror.exists(document_id=document_id)
+    assert not os.path.exists(mirror.local_path)
+
+@pytest.mark.asyncio
+async def test_url_document_mirror_stays_in_mirror_dir(client: AsyncClient, tmp_path, stub_origin):
+    product = await Product.create(name="Traversal")
+    url = stub_origin["base_url"] + "/secret.txt"
+    stub_origin["files"]["/secret.txt"] = b"secret"
+    response = await client.post(f"/documents/url/product/{product.id}", data={"url": url, "doc_type": "../../../esc"})
+    assert response.status_code == 400
+
+    # Rows created before the type was validated: the type never becomes part of the path
+    document = await Document.create(product=product, type="../../../esc", path_or_url=url)
+    service = MirrorService(mirror_dir=str(tmp_path / "mirror"), allowed_hosts={"127.0.0.1"})
+    try:
+        await service.run_once()
+    finally:
+        await service.shutdown()
+    mirror = await DocumentMirror.get(document_id=document.id)
+    assert mirror.status == "mirrored"
+    assert mirror.local_path == str(tmp_path / "mirror" / f"product_{product.id}" / f"{document.id}_secret.txt")
+    assert not (tmp_path / "esc").exists()
+    await Product.filter(id=product.id).delete()
+
+@pytest.mark.asyncio
+async def test_mirrored_active_content_is_not_served_inline(client: AsyncClient, tmp_path, stub_origin):
+    product = await Product.create(name="Active Content")
+    stub_origin["files"]["/page.html"] = b"<script>alert(1)</script>"
+    stub_origin["content_types"]["/page.html"] = "text/html"
+    stub_origin["files"]["/sheet.pdf"] = b"%PDF-1.4"
+    stub_origin["content_types"]["/sheet.pdf"] = "application/pdf"
+    html = await Document.create(product=product, type="other", path_or_url=f"{stub_origin['base_url']}/page.html")
+    pdf = await Document.create(product=product, type="pdf", path_or_url=f"{stub_origin['base_url']}/sheet.pdf")
+
+    # A copy left in the public media folder by an earlier version is deleted and fetched again
+    media_dir = tmp_path / "media"
+    legacy_path = media_dir / f"product_{product.id}" / "other" / "mirrored" / f"{html.id}_page.html"
+    legacy_path.parent.mkdir(parents=True)
+    legacy_path.write_bytes(b"<script>alert(1)</script>")
+    await DocumentMirror.create(
+        document_id=html.id, url=html.path_or_url, local_path=str(legacy_path), status="mirrored",
+        etag="stale", next_check_at=datetime.now(timezone.utc) + timedelta(days=1),
+    )
+
+    service = MirrorService(mirror_dir=str(tmp_path / "mirror"), allowed_hosts={"127.0.0.1"})
+    try:
+        await service.run_once()
+    finally:
+        await service.shutdown()
+    assert not legacy_path.exists()
+    mirror = await DocumentMirror.get(document_id=html.id)
+    assert mirror.status == "mirrored" and mirror.local_path.startswith(str(tmp_path / "mirror"))
+
+    # Nothing mirrored is reachable through the static /media mount
+    media_app = FastAPI()
+    media_app.mount("/media", PrecompressedStaticFiles(directory=str(media_dir)))
+    async with AsyncClient(app=media_app, base_url="http://test") as media_client:
+        response = await media_client.get(f"/media/product_{product.id}/other/mirrored/{html.id}_page.html")
+        assert response.status_code == 404
+    assert os.path.commonpath([os.path.realpath(mirror_service.mirror_dir), os.path.realpath(main.BASE_MEDIA_DIR)]) != os.path.realpath(main.BASE_MEDIA_DIR)
+
+    response = await client.get(f"/documents/{html.id}/content")
+    assert response.content == b"<script>alert(1)</script>"
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["content-disposition"].startswith("attachment")
+    response = await client.get(f"/documents/{pdf.id}/content")
+    assert response.headers["content-type"] == "application/pdf"
+    assert "content-disposition" not in response.headers
+    assert response.headers["x-content-type-options"] == "nosniff"
+    await Product.filter(id=product.id).delete()
+
+@pytest.mark.asyncio
+async def test_mirroring_refuses_non_public_hosts(tmp_path, stub_origin):
+    product = await Product.create(name="Internal URLs")
+    stub_origin["files"]["/data.txt"] = b"internal"
+    port = stub_origin["base_url"].rsplit(":", 1)[1]
+    stub_origin["redirects"]["/hop"] = f"http://localhost:{port}/data.txt" # Allowed host redirecting elsewhere
+    direct = await Document.create(product=product, type="other", path_or_url=f"http://localhost:{port}/data.txt")
+    redirected = await Document.create(product=product, type="other", path_or_url=f"{stub_origin['base_url']}/hop")
+
+    service = MirrorService(mirror_dir=str(tmp_path), allowed_hosts={"127.0.0.1"})
+    try:
+        await service.run_once()
+    finally:
+        await service.shutdown()
+    for document in (direct, redirected):
+        mirror = await DocumentMirror.get(document_id=document.id)
+        assert mirror.status == "failed" and "non-public address" in mirror.error
+    assert ("/hop", None) in stub_origin["requests"] and ("/data.txt", None) not in stub_origin["requests"]
+    assert not os.listdir(tmp_path)
+
+    assert not any(_is_public_address(a) for a in ("169.254.169.254", "10.0.0.1", "192.168.1.1", "::1", "::ffff:127.0.0.1", "100.64.0.1"))
+    assert _is_public_address("93.184.216.34")
+    await Product.filter(id=product.id).delete()
+
+@pytest.mark.asyncio
+async def test_mirroring_connects_to_the_checked_address(tmp_path, monkeypatch, stub_origin):
+    """
+    Test that a host is resolved once per connection and the socket goes to the checked
+    address, so a second (rebinding) DNS answer is never used.
+    """
+    from src.backend import mirroring
+
+    port = int(stub_origin["base_url"].rsplit(":", 1)[1])
+    answers = {"pinned.test": ["127.0.0.1"], "rebind.test": ["127.0.0.1"]}
+    lookups = []
+
+    async def fake_resolve(host, resolve_port):
+        lookups.append(host)
+        return answers[host]
+
+    monkeypatch.setattr(mirroring, "_resolve", fake_resolve)
+    product = await Product.create(name="Pinned URLs")
+    stub_origin["files"]["/pinned.txt"] = b"pinned"
+    pinned = await Document.create(product=product, type="other", path_or_url=f"http://pinned.test:{port}/pinned.txt")
+    rebound = await Document.create(product=product, type="other", path_or_url=f"http://rebind.test:{port}/pinned.txt")
+
+    service = MirrorService(mirror_dir=str(tmp_path), allowed_hosts={"pinned.test"})
+    try:
+        await service.run_once()
+    finally:
+        await service.shutdown()
+    assert (await DocumentMirror.get(document_id=pinned.id)).status == "mirrored" # Name only our resolver knows
+    mirror = await DocumentMirror.get(document_id=rebound.id)
+    assert mirror.status == "failed" and "non-public address 127.0.0.1" in mirror.error
+    assert sorted(lookups) == ["pinned.test", "rebind.test"] # One lookup per connection, no re-resolution
+    assert len(stub_origin["requests"]) == 1
+    await Product.filter(id=product.id).delete()
+
+@pytest.mark.asyncio
+async def test_mirroring_per_host_concurrency(client: AsyncClient, tmp_path, stub_origin):
+    service = MirrorService(mirror_dir=str(tmp_path), per_host_concurrency=1, allowed_hosts={"127.0.0.1"})
+    product = await Product.create(name="Many URLs")
+    stub_origin["delay"] = 0.05
+    for i in range(4):
+        stub_origin["files"][f"/doc{i}.txt"] = b"x"
+        await Document.create(product=product, type="other", path_or_url=f"{stub_origin['base_url']}/doc{i}.txt")
+    unreachable = await Document.create(product=product, type="other", path_or_url="http://127.0.0.1:9/nothing.pdf")
+    try:
+        await service.run_once()
+    finally:
+        await service.shutdown()
+    assert stub_origin["peak"] == 1 # One origin host, one request at a time
+    assert await DocumentMirror.filter(status="mirrored", document_id__in=[d.id for d in await product.documents]).count() == 4
+
+    response = await client.get(f"/documents/{unreachable.id}/content")
+    assert response.status_code == 307 and response.headers["location"] == unreachable.path_or_url
+    await Product.filter(id=product.id).delete()
+
+@pytest.mark.asyncio
+async def test_upload_documents_archive(client: AsyncClient, tmp_path, monkeypatch):
+    """
+    Test bulk document ingestion from a ZIP archive using the '<ref>/file' and '<ref>__file' conventions.
+    """
+    monkeypatch.setattr(main, "BASE_MEDIA_DIR", str(tmp_path))
+    await Product.all().delete()
+    p1 = await Product.create(name="Archive Product 1", ref="ARC-1")
+    p2 = await Product.create(name="Archive Product 2", ref="ARC-2")
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("ARC-1/datasheet.pdf", b"%PDF-1.4 fake")
+        zf.writestr("ARC-1/photo.png", b"png bytes")
+        zf.writestr("ARC-2__prices.csv", b"a,b\n1,2\n")
+        zf.writestr("UNKNOWN__manual.pdf", b"orphan")
+        zf.writestr("__MACOSX/ARC-1/._datasheet.pdf", b"metadata")
+
+    response = await client.post(
+        "/documents/upload/archive",
+        files={"archive": ("docs.zip", buffer.getvalue(), "application/zip")},
+    )
+    assert response.status_code == 200, response.text
+    job_id = response.json()["job_id"]
+
+    job = await wait_for_job(client, job_id)
+    assert job["status"] == "completed", job
+    assert job["result"]["documents_created"] == 3
+    assert job["result"]["skipped"] == 1
+    assert job["result"]["unmatched_refs"] == ["UNKNOWN"]
+
+    p1_docs = await Document.filter(product_id=p1.id).order_by("label")
+    assert [(d.type, d.label) for d in p1_docs] == [("pdf", "datasheet.pdf"), ("image", "photo.png")]
+    p2_docs = await Document.filter(product_id=p2.id)
+    assert [(d.type, d.label) for d in p2_docs] == [("excel", "ARC-2__prices.csv")]
+    with open(p1_docs[0].path_or_url, "rb") as f:
+        assert f.read() == b"%PDF-1.4 fake"
+    assert os.path.dirname(p1_docs[0].path_or_url) == os.path.join(str(tmp_path), f"product_{p1.id}", "pdf")
+
+@pytest.mark.asyncio
+async def test_upload_documents_archive_with_manifest(client: AsyncClient, tmp_path, monkeypatch):
+    """
+    Test that a manifest.csv at the archive root maps files, types and labels.
+    """
+    monkeypatch.setattr(main, "BASE_MEDIA_DIR", str(tmp_path))
+    await Product.all().delete()
+    product = await Product.create(name="Manifest Product", ref="MAN-1")
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("manifest.csv", "file,reference,type,label\nfiles/a.bin,MAN-1,other,Spec sheet\n")
+        zf.writestr("files/a.bin", b"binary")
+        zf.writestr("files/b.bin", b"not in manifest")
+
+    response = await client.post(
+        "/documents/upload/archive?priority=nightly", # Same query parameter as the product imports
+        files={"archive": ("docs.zip", buffer.getvalue(), "application/zip")},
+    )
+    job = await wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "completed", job
+    assert job["details"]["priority"] == "nightly"
+    assert job["result"]["documents_created"] == 1
+    assert job["result"]["skipped"] == 1
+
+    docs = await Document.filter(product_id=product.id)
+    assert [(d.type, d.label) for d in docs] == [("other", "Spec sheet")]
+
+@pytest.mark.asyncio
+async def test_upload_documents_archive_invalid_type(client: AsyncClient):
+    response = await client.post(
+        "/documents/upload/archive",
+        files={"archive": ("docs.rar", b"whatever", "application/octet-stream")},
+    )
+    assert response.status_code == 400
+
 # TODO: Add more tests:
 # - Test product update (PUT /products/{product_id})
 # - Test product deletion (DELETE /products/{product_id})
@@ -177,4 +1102,3 @@ async def test_get_existing_product(client: AsyncClient):
 # - Test document deletion (DELETE /documents/{document_id})
 # - Test import functionality (POST /import/products-file/) - requires file mocking
 
-EOF